@@ -1,111 +1,487 @@
-import copy
-
-from resilsim.objects.Metrics import Metrics
-from resilsim.objects.UE import UserEquipment
+import argparse
+import math
+import os
+import time
+
+from resilsim.objects.Checkpoint import Checkpoint
+from resilsim.objects.Results import Results
+from resilsim.objects.UE import UEPopulation
 import resilsim.settings as settings
 import numpy as np
 import resilsim.util as util
 import json
 import resilsim.objects.BaseStation as BSO
 import resilsim.objects.City as City
+from resilsim.objects.SpatialIndex import SpatialIndex
+from resilsim.objects.Catalogue import Catalogue
+from resilsim.objects.Candidates import Candidates
+from resilsim.objects.LinkBudget import LinkBudget, Powers
+from resilsim.objects.Baseline import Baseline
+from resilsim.objects.NetworkState import NetworkState
+from resilsim.objects.RandomStream import RandomStream
+from resilsim.objects.Scenario import Scenario
 
 from multiprocessing import Pool
 
 
-def main():
+def main(resume=False, grid=None, overwrite=False):
+    """
+    Simulates every scenario of all cities and reports their results.
+    The scenarios share the cities, base stations and users, their tasks run in one pool
+    :param resume: continue the run in settings.CHECKPOINT_PATH, the finished tasks are not simulated again
+    :param grid: Dict(String: List) the values of the scenario parameters to simulate every combination of,
+    settings.SCENARIOS when None (see Scenario.grid)
+    :param overwrite: start a new run over the checkpoint of an unfinished run in settings.CHECKPOINT_PATH
+    :return: None
+    """
+    scenarios = Scenario.grid(settings.SCENARIOS if grid is None else grid)
+    all_cities = load_cities()
+    # A job is a city in a scenario, the tasks and results are per job
+    jobs = [(c, s) for s in range(len(scenarios)) for c in range(len(all_cities))]
+
+    for scenario in scenarios:
+        if settings.SAVE_IN_CSV:
+            util.create_new_file(scenario.path(settings.SAVE_CSV_PATH))
+        if settings.SAVE_IN_STORE:
+            util.create_new_store(scenario.path(settings.SAVE_STORE_PATH))
+
+    # Every random number of the run derives from this seed, print it so the run can be repeated
+    root = np.random.SeedSequence(settings.SEED)
+    checkpoint = None
+    if settings.CHECKPOINT_PATH is not None:
+        checkpoint = Checkpoint(settings.CHECKPOINT_PATH, [job_name(all_cities, scenarios, job) for job in jobs],
+                                root.entropy, resume, overwrite)
+        root = np.random.SeedSequence(checkpoint.entropy)
+    elif resume:
+        raise ValueError("Resuming a run needs settings.CHECKPOINT_PATH")
+    print(f"Seed: {root.entropy}")
+
+    # Static data of every city, placed in shared memory that the workers attach to.
+    # The base stations get the mmWave channels of the scenario with the highest probability, the other scenarios
+    # disable some of them
+    mmwave_probability = max(scenario.MMWAVE_PROBABILITY for scenario in scenarios)
+    shared = []
+    worker_cities = []
+    costs = []  # estimated cost of a round of each city
+    try:
+        for c, city in enumerate(all_cities):
+            base_stations = load_bs(city, np.random.default_rng(task_seed(root, c)), mmwave_probability)
+            s = 0
+            for b in base_stations:
+                s += len(b.channels)
+            print(
+                f"{city.name}: number of channels:{s}, max users per channel = {base_stations[0].channels[0].max_devices}; users = {city.active_users}; max users connecting: {base_stations[0].channels[0].max_devices * s}")
+            connected_base_stations(base_stations)
+            shm, layout = Catalogue(base_stations).to_shared_memory()
+            shared.append(shm)
+            worker_cities.append((city, shm.name, layout))
+            costs.append(city.active_users * s)
+        costs = [costs[c] for c, _ in jobs]
+
+        argument_list = arg_list(jobs, scenarios, root)
+        if settings.ADAPTIVE_STOPPING:
+            samples = max(settings.ROUNDS_PER_USER, settings.ADAPTIVE_MAX_ROUNDS_PER_USER) * settings.ROUNDS_PER_SEVERITY
+            results = [Results(samples=samples) for _ in jobs]
+        else:
+            results = [Results() for _ in jobs]
+        if checkpoint is not None:
+            for j in range(len(jobs)):
+                for (u, _, r), values in checkpoint.finished[j].items():
+                    for severity, v in values:
+                        results[j].add(severity, u * settings.ROUNDS_PER_SEVERITY + r, v)
+            argument_list = [task for task in argument_list if not checkpoint.is_finished(*task[:4])]
+        argument_list = largest_first(argument_list, costs)
+        remaining = [0] * len(jobs)
+        for task in argument_list:
+            remaining[task[0]] += 1
+
+        # Single threaded, replace the pool by
+        #        init_worker(worker_cities, scenarios, jobs)
+        #        res = map(pool_task, argument_list)
+
+        # multi threaded
+        processes = settings.AMOUNT_THREADS or os.cpu_count()
+        with Pool(processes, initializer=init_worker, initargs=(worker_cities, scenarios, jobs)) as p:
+            if settings.ADAPTIVE_STOPPING:
+                adaptive_run(p, processes, results, root, costs, jobs, scenarios, checkpoint)
+                for j, (c, s) in enumerate(jobs):
+                    report(all_cities[c], scenarios[s], results[j])
+            else:
+                res = p.imap_unordered(pool_task, argument_list,
+                                       chunksize=chunk_size(len(argument_list), processes, len(scenarios)))
+
+                # Tasks of all jobs share the pool, a job is reported as soon as its last task is done.
+                # The jobs finished before resuming are reported first
+                for j, (c, s) in enumerate(jobs):
+                    if remaining[j] == 0:
+                        report(all_cities[c], scenarios[s], results[j])
+                for j, u, severity, r, values in res:
+                    remaining[j] -= 1
+                    for s, v in values:
+                        results[j].add(s, u * settings.ROUNDS_PER_SEVERITY + r, v)
+                    if checkpoint is not None:
+                        checkpoint.add(j, u, severity, r, values)
+                    if remaining[j] == 0:
+                        c, s = jobs[j]
+                        report(all_cities[c], scenarios[s], results[j])
+        if checkpoint is not None:
+            checkpoint.complete()
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        for shm in shared:
+            shm.close()
+            shm.unlink()
+
+    if settings.CREATE_PLOT:
+        util.create_plot({job_name(all_cities, scenarios, job): results[j] for j, job in enumerate(jobs)},
+                         {job_name(all_cities, scenarios, job): scenarios[job[1]] for job in jobs})
+
+
+def job_name(cities, scenarios, job):
+    """
+    :param cities: the cities of the run
+    :param scenarios: the scenarios of the run
+    :param job: tuple (index of the city, index of the scenario)
+    :return: name of the city, followed by the name of the scenario when it has one
+    """
+    c, s = job
+    return f"{cities[c].name}: {scenarios[s].name}" if scenarios[s].name else cities[c].name
+
+
+def report(city, scenario, results):
+    """
+    Prints the results of a city in a scenario and saves them when enabled
+    :param city: the city
+    :param scenario: the scenario
+    :param results: the results of the city
+    :return: None
+    """
+    print("\nResults for city:{}".format(city.name) + (" ({})".format(scenario.name) if scenario.name else ""))
+    print(results)
+    print("------------------------------------------------------\n")
+
     if settings.SAVE_IN_CSV:
-        util.create_new_file()
+        util.save_data(city, results, scenario.path(settings.SAVE_CSV_PATH))
+    if settings.SAVE_IN_STORE:
+        util.save_store(city, results, scenario.path(settings.SAVE_STORE_PATH))
 
-    all_cities = load_cities()
-    city_results = dict()
-
-    for city in all_cities:
-        print("Starting simulation for city:{}".format(city.name))
-        base_stations = load_bs(city)
-        s = 0
-        for b in base_stations:
-            s += len(b.channels)
-        print(
-            f"number of channels:{s}, max users per channel = {base_stations[0].channels[0].max_devices}; users = {city.active_users}; max users connecting: {base_stations[0].channels[0].max_devices * s}")
-        results = []
-        for s in range(settings.SEVERITY_ROUNDS):
-            results.append(Metrics())
 
-        argument_list = arg_list(city, base_stations)
+def adaptive_run(p, processes, results, root, costs, jobs, scenarios, checkpoint=None):
+    """
+    Simulates ROUNDS_PER_USER rounds per user for every job and severity, after which rounds per user are added
+    in waves for the combinations whose confidence intervals are wider than settings.ADAPTIVE_HALF_WIDTH.
+    The combinations with the largest uncertainty over all jobs get the next rounds, until every target is reached
+    or the round or time budget is used up
+    :param p: the pool
+    :param processes: number of worker processes
+    :param results: results of each job, filled with the rounds
+    :param root: SeedSequence of the run
+    :param costs: estimated cost of a round of each job, see largest_first
+    :param jobs: tuple (index of the city, index of the scenario) of each job
+    :param scenarios: the scenarios
+    :param checkpoint: checkpoint of the run, its restored tasks are in the results already
+    :return: None
+    """
+    start = time.time()
+    # Rounds per user simulated by each (job, severity)
+    next_u = {(j, severity): settings.ROUNDS_PER_USER for j, (_, s) in enumerate(jobs)
+              for severity in severities(scenarios[s])}
+    tasks = arg_list(jobs, scenarios, root)
+    rounds = 0
+    if checkpoint is not None:
+        # Continue with the rounds per user of the last wave before the run was interrupted
+        for j in range(len(jobs)):
+            for u, severity, _ in checkpoint.finished[j]:
+                next_u[(j, severity)] = max(next_u[(j, severity)], u + 1)
+                rounds += settings.SEVERITY_ROUNDS if severity is None else 1
+        tasks = [(j, u, severity, r, task_seed(root, jobs[j][0], u))
+                 for (j, severity), end in next_u.items()
+                 for u in range(end)
+                 for r in range(settings.ROUNDS_PER_SEVERITY)
+                 if not checkpoint.is_finished(j, u, severity, r)]
+    while True:
+        # A resumed run stopped between two waves has no tasks left, its next wave is planned right away
+        tasks = largest_first(tasks, costs)
+        for j, u, severity, r, values in p.imap_unordered(pool_task, tasks,
+                                                          chunksize=chunk_size(len(tasks), processes, len(scenarios))):
+            for s, v in values:
+                results[j].add(s, u * settings.ROUNDS_PER_SEVERITY + r, v)
+            if checkpoint is not None:
+                checkpoint.add(j, u, severity, r, values)
+        rounds += sum(settings.SEVERITY_ROUNDS if task[2] is None else 1 for task in tasks)
+
+        # Next wave, one round per user for each worker
+        if settings.ADAPTIVE_MAX_TIME is not None and time.time() - start >= settings.ADAPTIVE_MAX_TIME:
+            break
+        budget = math.inf if settings.ADAPTIVE_MAX_ROUNDS is None else settings.ADAPTIVE_MAX_ROUNDS - rounds
+        uncertainty = {cell: cell_uncertainty(results[cell[0]], cell[1]) for cell in next_u}
+        open_cells = sorted((cell for cell in next_u if uncertainty[cell] > 1 and
+                             next_u[cell] < settings.ADAPTIVE_MAX_ROUNDS_PER_USER),
+                            key=lambda cell: uncertainty[cell], reverse=True)
+        tasks = []
+        while len(open_cells) > 0 and len(tasks) < processes * settings.ROUNDS_PER_SEVERITY:
+            for cell in open_cells[:]:
+                cost = settings.ROUNDS_PER_SEVERITY * (settings.SEVERITY_ROUNDS if cell[1] is None else 1)
+                if next_u[cell] >= settings.ADAPTIVE_MAX_ROUNDS_PER_USER or cost > budget:
+                    open_cells.remove(cell)
+                    continue
+                j, severity = cell
+                u = next_u[cell]
+                seed = task_seed(root, jobs[j][0], u)
+                tasks += [(j, u, severity, r, seed) for r in range(settings.ROUNDS_PER_SEVERITY)]
+                next_u[cell] += 1
+                budget -= cost
+        print("\nAdaptive stopping: {} rounds done, {} rounds added".format(rounds, len(tasks)))
+        if len(tasks) == 0:
+            break
+
+
+def cell_uncertainty(results, severity):
+    """
+    Determines how far the confidence intervals of a severity are from their targets
+    :param results: the results of a job
+    :param severity: the severity, None for all severities
+    :return: the largest ratio of confidence interval half-width and target, infinite with one round
+    """
+    half_width = results.get_cdf()
+    counts = results.counts()
+    rows = range(results.cube.shape[0]) if severity is None else [severity]
+    worst = 0
+    for s in rows:
+        filled = np.count_nonzero(results.filled[s])
+        if filled == 0:
+            continue  # Nothing fails for this severity
+        if filled < 2:
+            return math.inf
+        for m, target in settings.ADAPTIVE_HALF_WIDTH.items():
+            # Metrics without values in at least two rounds can not improve
+            if counts[s, m] >= 2:
+                worst = max(worst, half_width[s, m] / target)
+    return worst
+
+
+# Static data of the cities and scenarios simulated by this worker process, set by init_worker
+worker_data = dict()
+
+
+def init_worker(cities, scenarios, jobs):
+    """
+    Stores the static data of the cities and the scenarios in the worker process, called once per worker by the pool.
+    The shared memory of a city is attached the first time the worker gets a task of that city
+    :param cities: list of tuples (city, name of the shared memory block holding the catalogue of the basestations,
+    layout of the catalogue in the shared memory block)
+    :param scenarios: the scenarios
+    :param jobs: tuple (index of the city, index of the scenario) of each job
+    :return: None
+    """
+    worker_data['cities'] = cities
+    worker_data['scenarios'] = scenarios
+    worker_data['jobs'] = jobs
+    worker_data['attached'] = dict()
+    worker_data['states'] = dict()
+    worker_data['population'] = None
 
-        # Single threaded
-        #        for (u,bs,c) in argument_list:
-        #            res = pool_func(u,bs,c)
-        #            for m in range(len(res)):
-        #                results[m].add_metrics_object(res[m])
 
-        # multi threaded
-        with Pool(settings.AMOUNT_THREADS) as p:
-            res = p.starmap(pool_func, argument_list)
+def city_data(c):
+    """
+    Gets the static data of a city in a worker process, attaching to its shared memory when needed
+    :param c: index of the city
+    :return: tuple (city, catalogue, spatial index)
+    """
+    if c not in worker_data['attached']:
+        city, shm_name, layout = worker_data['cities'][c]
+        catalogue = Catalogue.from_shared_memory(shm_name, layout)
+        index = SpatialIndex(catalogue.bs_lon, catalogue.bs_lat)
+        worker_data['attached'][c] = (city, catalogue, index)
+    return worker_data['attached'][c]
 
-            for r in res:
-                for m in range(len(r)):
-                    results[m].add_metrics_object(r[m])
 
-        print("")
-        for r in results:
-            print(r)
-        print("------------------------------------------------------\n")
-        city_results[city] = results
+def job_state(j):
+    """
+    Gets the state of the channels of a job in a worker process, the mmWave channels the scenario does not have
+    are never enabled. All scenarios of a city share one state, the channels of the scenario are applied when the
+    state was last used for another job; every round resets the state before it is used
+    :param j: index of the job
+    :return: network state
+    """
+    c, s = worker_data['jobs'][j]
+    if c not in worker_data['states']:
+        city, catalogue, _ = city_data(c)
+        worker_data['states'][c] = (None, NetworkState(catalogue, city.active_users))
+    last, state = worker_data['states'][c]
+    if last != j:
+        state.available[:] = ~state.catalogue.mmwave_disabled(worker_data['scenarios'][s].MMWAVE_PROBABILITY)
+        state.reset()
+        worker_data['states'][c] = (j, state)
+    return state
+
+
+def arg_list(jobs, scenarios, root=None):
+    """
+    Creates an argument list with a task for each round of each job.
+    The tasks of a round per user of a city follow each other for all scenarios, so a worker reuses the users
+    :param jobs: tuple (index of the city, index of the scenario) of each job
+    :param scenarios: the scenarios
+    :param root: SeedSequence of the run, from settings.SEED when None
+    :return: List((Int,Int,Int,Int,SeedSequence)) For each round the job, round per user, severity, round and
+    the seed of the users of the round. With a radius sweep one task simulates all severities, its severity is None.
+    The users of a round per user of a city are the same in every scenario
+    """
+    if root is None:
+        root = np.random.SeedSequence(settings.SEED)
+    cities = sorted(set(c for c, _ in jobs))
+    return [(j, u, severity, r, task_seed(root, c, u))
+            for c in cities
+            for u in range(settings.ROUNDS_PER_USER)
+            for j, (job_city, s) in enumerate(jobs) if job_city == c
+            for severity in severities(scenarios[s])
+            for r in range(settings.ROUNDS_PER_SEVERITY)]
+
+
+def severities(scenario):
+    """
+    :param scenario: the scenario
+    :return: the severities of the tasks of a scenario, None when one task simulates all severities
+    """
+    return [None] if scenario.radius_sweep() else list(range(settings.SEVERITY_ROUNDS))
 
-        if settings.SAVE_IN_CSV:
-            util.save_data(city, results)
 
-    if settings.CREATE_PLOT:
-        util.create_plot(city_results)
+def task_seed(root, *key):
+    """
+    Derives an independent seed from the seed of the run, like SeedSequence.spawn but addressed by a key
+    so the seed of a task does not depend on the other tasks
+    :param root: SeedSequence of the run
+    :param key: Ints identifying the task, (city,) for loading a city and (city, round per user) for a population
+    :return: SeedSequence of the task
+    """
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + key)
 
 
-def arg_list(city, base_stations):
+def round_seed(seed, *key):
     """
-    Creates an argument list with the needed arguments for each round
-    :param city: The city list used as argument ofr each round
-    :param base_stations: The base stations used as argument each round
-    :return: List((Int,BaseStation,City)) For each round a unique basestation and city
+    :param seed: SeedSequence of a population
+    :param key: Ints identifying a stream of the population, see the *_STREAM constants
+    :return: SeedSequence of the stream
     """
-    res = []
-    for u in range(settings.ROUNDS_PER_USER):
-        # copy_bs = [bs.get_copy() for bs in base_stations]
-        copy_bs = copy.deepcopy(base_stations)
-        res.append((u, copy_bs, city))
-    return res
+    return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + key)
 
 
-def pool_func(u, base_stations, city):
+# Random streams below the seed of a population, the fixed powers use LinkBudget.FIXED_POWERS
+ROUND_STREAM = 0
+SWEEP_STREAM = 1
+
+
+def largest_first(tasks, costs):
     """
-    Function to be called by the pool manager
-    :param u: the round per user
-    :param base_stations: the basestations for the round
-    :param city: the city
-    :return: a dictionary with for each severity the resilience metrics
+    Orders the tasks so the rounds of the most expensive cities are handed out first and the rounds of the cheap
+    cities fill the gaps at the end. The order of the tasks within a city is kept, so the tasks of a round per user
+    stay together and a worker reuses their users
+    :param tasks: list of tasks, see arg_list
+    :param costs: estimated cost of a round of each job, the number of users times the number of channels of its city
+    :return: the ordered tasks
     """
-    results = []
-    for s in range(settings.SEVERITY_ROUNDS):
-        results.append(Metrics())
+    return sorted(tasks, key=lambda task: -costs[task[0]])
 
-    links = connected_base_stations(base_stations)
-    UE = create_ue(city)
-    for severity in range(settings.SEVERITY_ROUNDS):
-        for r in range(settings.ROUNDS_PER_SEVERITY):
-            print("\rStarting simulation:({},{},{})".format(u, severity, r), end='')
-            # print("Resetting base stations and UE")
-            reset_all(base_stations, UE)
-            # print("Failing base stations and links")
-            if not fail(base_stations, UE, links, city, severity):
-                print("Nothing to fail")
-                continue  # Nothing to fail due to no events enabled
-            # print("Connecting UE to BS again")
-            connect_ue_bs(UE, base_stations, severity)
-            # print("Directing capacities to the users")
-            # print("Creating resilience metrics after failure")
-            values = simulate(base_stations, UE, links)
-            results[severity].add_metric(values)
-
-    return results
+
+def chunk_size(tasks, processes, scenarios=1):
+    """
+    Determines the number of tasks send to a worker at once.
+    Small enough that the workers finish at about the same time, large enough to limit the communication overhead
+    and to give the tasks of a round per user in every scenario to the same worker
+    :param tasks: total number of tasks
+    :param processes: number of worker processes
+    :param scenarios: number of scenarios
+    :return: the chunk size
+    """
+    return max(1, min(settings.ROUNDS_PER_SEVERITY * settings.SEVERITY_ROUNDS * scenarios, tasks // (processes * 8)))
+
+
+def pool_task(args):
+    """
+    Unpacks the arguments of a task for imap_unordered
+    :param args: the arguments of pool_func
+    :return: the result of pool_func
+    """
+    return pool_func(*args)
+
+
+def pool_func(j, u, severity, r, seed):
+    """
+    Function to be called by the pool manager, simulates one round of a city in a scenario with the data stored by
+    init_worker
+    :param j: index of the job, the city and scenario
+    :param u: the round per user
+    :param severity: the severity of the round, None for a sweep over all radii of a large disaster
+    :param r: the round within the severity
+    :param seed: SeedSequence of the users of the round per user, the round draws from its own stream below it
+    :return: tuple (j, u, severity, r, list of tuples (severity, array with the resilience metrics)),
+    the list is empty when nothing failed
+    """
+    c, s = worker_data['jobs'][j]
+    scenario = worker_data['scenarios'][s]
+    city, catalogue, index = city_data(c)
+    state = job_state(j)
+
+    # The users, their candidate base stations and link budgets only depend on the round per user,
+    # consecutive tasks of a worker usually share them, also between scenarios
+    key = (c, u, seed.entropy, seed.spawn_key)
+    if worker_data['population'] is None or worker_data['population'][0] != key:
+        UE = create_ue(city, np.random.default_rng(seed))
+        candidates = Candidates(index, catalogue, UE)
+        budget = LinkBudget(catalogue, candidates)
+        worker_data['population'] = (key, UE, candidates, budget, dict())
+    _, UE, candidates, budget, baselines = worker_data['population']
+    baseline = None
+    # Increasing the requested data changes the users, the baseline does not hold then
+    if scenario.DELTA_RECONNECTION and \
+            (scenario.LARGE_DISASTER or scenario.MALICIOUS_ATTACK or not scenario.INCREASING_REQUESTED_DATA):
+        if j not in baselines:
+            baselines[j] = Baseline(UE, state, candidates, budget, seed)
+        baseline = baselines[j]
+
+    # Every round has its own random stream, which makes the result independent of the order of the tasks
+    rng = RandomStream(round_seed(seed, SWEEP_STREAM, r) if severity is None else
+                       round_seed(seed, ROUND_STREAM, severity, r))
+
+    print("\rStarting simulation:({},{},{},{},{})".format(city.name, scenario, u, severity, r), end='')
+    if severity is None:
+        results = []
+        for sev in disaster_sweep(state, UE, city, rng, scenario):
+            connect(state, UE, sev, candidates, budget, rng, baseline)
+            results.append((sev, np.array(simulate(state, UE), dtype=float)))
+        return j, u, severity, r, results
+
+    # print("Resetting base stations and UE")
+    reset_all(state, UE)
+    # print("Failing base stations and links")
+    if not fail(state, UE, city, severity, rng, scenario):
+        print("Nothing to fail")
+        return j, u, severity, r, []  # Nothing to fail due to no events enabled
+    # print("Connecting UE to BS again")
+    connect(state, UE, severity, candidates, budget, rng, baseline)
+    # print("Directing capacities to the users")
+    # print("Creating resilience metrics after failure")
+    values = np.array(simulate(state, UE), dtype=float)
+    return j, u, severity, r, [(severity, values)]
+
+
+def connect(state, ue, severity, candidates, budget, rng, baseline=None):
+    """
+    Connects the UEs after a failure, with the delta reconnection when a baseline is given
+    :param state: state of the channels of the base stations
+    :param ue: population of UEs
+    :param severity: the severity of the round
+    :param candidates: base stations in range of each UE
+    :param budget: cached link budgets of the candidates
+    :param rng: RandomStream of the round
+    :param baseline: association without failures of the UEs
+    :return: None
+    """
+    if baseline is not None:
+        baseline.reconnect(state, ue)
+    else:
+        connect_ue_bs(ue, state, severity, candidates=candidates, budget=budget, rng=rng)
 
 
 def connected_base_stations(base_stations):
@@ -127,72 +503,121 @@ def connected_base_stations(base_stations):
 
 
 # TODO change distribution
-def create_ue(city):
+def create_ue(city, rng=None):
     """
     Creates the user equipment
     :param city: City for which to create the UEs
-    :return: list of UEs
+    :param rng: numpy Generator of the population, a new unseeded one when None
+    :return: population of UEs
     """
-    all_UE = list()
+    if rng is None:
+        rng = np.random.default_rng()
     all_users = city.active_users
-    all_lon = np.random.uniform(city.min_lon, city.max_lon, all_users)
-    all_lat = np.random.uniform(city.min_lat, city.max_lat, all_users)
-    all_cap = np.random.randint(settings.UE_CAPACITY_MIN, settings.UE_CAPACITY_MAX, all_users)
-    for i in range(all_users):
-        lon = all_lon[i]
-        lat = all_lat[i]
-
-        new_UE = UserEquipment(i, lon, lat, all_cap[i])
-        all_UE.append(new_UE)
-
-    return all_UE
-
-
-def connect_ue_bs(ue, base_stations, severity=0):
-    for user in ue:
-        BS_in_area = []
-        # Collect all BS within range
-        for bs in base_stations:
-            dist = util.distance(user.lat, user.lon, bs.lat, bs.lon)
-            if dist <= settings.BS_RANGE:
-                BS_in_area.append((bs, dist))
-
-        # Sort BS in area on from closest to farthest
-        BS_in_area = sorted(BS_in_area, key=lambda x: x[1])
+    all_lon = rng.uniform(city.min_lon, city.max_lon, all_users)
+    all_lat = rng.uniform(city.min_lat, city.max_lat, all_users)
+    all_cap = rng.integers(settings.UE_CAPACITY_MIN, settings.UE_CAPACITY_MAX, all_users)
+
+    return UEPopulation(all_lon, all_lat, all_cap)
+
+
+def connect_ue_bs(ue, state, severity=0, index=None, candidates=None, budget=None, powers=None, rng=None):
+    """
+    Connects every UE to the closest base station in range that accepts it
+    :param ue: population of UEs
+    :param state: state of the channels of the base stations
+    :param severity: the severity of the round
+    :param index: spatial index over the base stations, built when not given and candidates are not given
+    :param candidates: base stations in range of each UE, built when not given
+    :param budget: cached link budgets of the candidates, built when not given
+    :param powers: function giving the received powers of the candidate link at a position (see Baseline.power),
+    drawn for this round when not given
+    :param rng: RandomStream of the round, the global numpy random state when None
+    :return: None
+    """
+    catalogue = state.catalogue
+    if candidates is None:
+        if index is None:
+            index = SpatialIndex(catalogue.bs_lon, catalogue.bs_lat)
+        candidates = Candidates(index, catalogue, ue)
+    if budget is None:
+        budget = LinkBudget(catalogue, candidates)
+    # Base stations without an enabled channel reject every UE
+    alive = state.alive_stations()
+    # Received powers are calculated in batches, the first time a UE reaches a rank its batch is calculated
+    # for the next UEs at that rank, see candidate_batch
+    round_powers = Powers(budget)
+    # Positions of the candidates at alive base stations, the others are skipped without trying them
+    live = np.flatnonzero(alive[candidates.bs])
+    live_ptr = np.searchsorted(live, candidates.indptr).tolist()
+    indptr = candidates.indptr.tolist()
+    for k in range(len(candidates)):
         # Loop over BSs connecting when possible
-        for bs, dist in BS_in_area:
-            if bs.add_ue(user):
+        for p in live[live_ptr[k]:live_ptr[k + 1]]:
+            rank = p - indptr[k]
+            i = candidates.bs[p]
+            if powers is not None:
+                power = powers(p)
+            else:
+                if not round_powers.has(p):
+                    round_powers.add(candidate_batch(candidates, alive, rank, k), rng)
+                power = round_powers.get(p)
+            if state.add_ue(ue, k, i, float(candidates.d_2d[p]), power):
                 break
 
 
-def fail(base_stations, ue, links, city, severity):
-    if settings.LARGE_DISASTER:
-        radius = severity * settings.RADIUS_PER_SEVERITY
-        random_lat = np.random.uniform(city.min_lat, city.max_lat, 1)[0]
-        random_lon = np.random.uniform(city.min_lon, city.max_lon, 1)[0]
+def candidate_batch(candidates, alive, rank, first):
+    """
+    Selects the links of a batch of received powers: the rank-th candidates of the next settings.POWER_BATCH_SIZE UEs,
+    as far as their base station is alive. The UEs after the batch may connect before they reach the rank
+    :param candidates: base stations in range of each UE
+    :param alive: for each base station True if it has an enabled channel
+    :param rank: which candidate base station to use (0 is the closest)
+    :param first: the first UE of the batch
+    :return: positions of the links in the candidate arrays
+    """
+    last = min(first + settings.POWER_BATCH_SIZE, len(candidates))
+    ue_indices = first + np.flatnonzero(np.diff(candidates.indptr[first:last + 1]) > rank)
+    positions = candidates.indptr[ue_indices] + rank
+    return positions[alive[candidates.bs[positions]]]
 
-        for bs in base_stations:
-            dist = util.distance(bs.lat, bs.lon, random_lat, random_lon)
-            if dist < radius:
-                if settings.POWER_OUTAGE:
-                    bs.malfunction(0)
-                else:
-                    # When closer to the epicentre the BS will function less
-                    bs.malfunction((dist / radius) ** 2)
 
-    elif settings.MALICIOUS_ATTACK:
-        affected_bs = np.random.choice(base_stations, round(len(base_stations) * settings.PERCENTAGE_BASE_STATIONS),
+def fail(state, ue, city, severity, rng, scenario=None):
+    """
+    Fails the network for one round of a severity
+    :param state: state of the channels of the base stations
+    :param ue: population of UEs
+    :param city: the city
+    :param severity: the severity
+    :param rng: RandomStream of the round
+    :param scenario: the scenario, the settings when None
+    :return: False if nothing is failed in the scenario
+    """
+    if scenario is None:
+        scenario = Scenario()
+    catalogue = state.catalogue
+    generator = rng.generator
+    if scenario.LARGE_DISASTER:
+        radius = severity * scenario.RADIUS_PER_SEVERITY
+        random_lat = generator.uniform(city.min_lat, city.max_lat)
+        random_lon = generator.uniform(city.min_lon, city.max_lon)
+
+        all_dist = np.sqrt((catalogue.bs_lat - random_lat) ** 2 + (catalogue.bs_lon - random_lon) ** 2)
+        for bs in np.flatnonzero(all_dist < radius):
+            if scenario.POWER_OUTAGE:
+                state.malfunction(bs, 0, rng)
+            else:
+                # When closer to the epicentre the BS will function less
+                state.malfunction(bs, (all_dist[bs] / radius) ** 2, rng)
+
+    elif scenario.MALICIOUS_ATTACK:
+        affected_bs = generator.choice(len(catalogue), round(len(catalogue) * scenario.PERCENTAGE_BASE_STATIONS),
                                        replace=False)
         for bs in affected_bs:
-            bs.malfunction(1 - (severity * settings.FUNCTIONALITY_DECREASED_PER_SEVERITY))
+            state.malfunction(bs, 1 - (severity * scenario.FUNCTIONALITY_DECREASED_PER_SEVERITY), rng)
 
-    elif settings.INCREASING_REQUESTED_DATA:
-        x = settings.OFFSET + settings.DATA_PER_SEV * severity
-        all_cap = np.random.randint(x, x + settings.WINDOW_SIZE, city.active_users)
-        for i in range(len(ue)):
-            user = ue[i]
-            cap = all_cap[i]
-            user.requested_capacity = cap
+    elif scenario.INCREASING_REQUESTED_DATA:
+        x = scenario.OFFSET + scenario.DATA_PER_SEV * severity
+        ue.requested_capacity[:] = generator.integers(x, x + scenario.WINDOW_SIZE, city.active_users)
 
     else:
         return severity == 0
@@ -200,32 +625,73 @@ def fail(base_stations, ue, links, city, severity):
     return True
 
 
-def simulate(base_stations, ue, links):
+def disaster_sweep(state, ue, city, rng, scenario=None):
+    """
+    Fails the network for the radius of every severity around one epicentre, for a large disaster.
+    The base stations are sorted by distance to the epicentre once and every channel gets one random number
+    for all radii, so the failures of a radius are also failures of every larger radius (common random numbers)
+    :param state: state of the channels of the base stations
+    :param ue: population of UEs
+    :param city: the city
+    :param rng: RandomStream of the round
+    :param scenario: the scenario, the settings when None
+    :return: generator giving the severity after the state is reset and failed for it
+    """
+    if scenario is None:
+        scenario = Scenario()
+    catalogue = state.catalogue
+    random_lat = rng.generator.uniform(city.min_lat, city.max_lat)
+    random_lon = rng.generator.uniform(city.min_lon, city.max_lon)
+    all_dist = np.sqrt((catalogue.bs_lat - random_lat) ** 2 + (catalogue.bs_lon - random_lon) ** 2)
+    order = np.argsort(all_dist, kind='stable')
+    ch_dist = all_dist[catalogue.ch_bs]
+    ch_order = np.argsort(ch_dist, kind='stable')
+    draws = rng.random(catalogue.channel_count)
+
+    failed = np.zeros(catalogue.channel_count, dtype=bool)
+    for severity in range(settings.SEVERITY_ROUNDS):
+        radius = severity * scenario.RADIUS_PER_SEVERITY
+        # Base stations and channels within the radius, the rings of the smaller radii were failed before
+        stations = order[:np.searchsorted(all_dist[order], radius, side='left')]
+        channels = ch_order[:np.searchsorted(ch_dist[ch_order], radius, side='left')]
+        if scenario.POWER_OUTAGE:
+            functional = np.zeros(len(stations))
+            failed[channels] = True
+        else:
+            # When closer to the epicentre the BS will function less
+            functional = (all_dist[stations] / radius) ** 2
+            failed[channels] |= draws[channels] >= (ch_dist[channels] / radius) ** 2
+        reset_all(state, ue)
+        state.functional[stations] = functional
+        state.enabled[failed] = False
+        yield severity
+
+
+def simulate(state, ue):
+    capacity = util.shannon_capacity(state, ue)
+
     iso_users = util.isolated_users(ue)
-    percentage_received_service = util.received_service(ue)
+    percentage_received_service = util.received_service(ue, capacity)
 
-    percentage_received_service_half = util.received_service_half(ue)
+    percentage_received_service_half = util.received_service_half(ue, capacity)
     average_distance_to_bs = util.avg_distance(ue)
 
-    iso_systems = util.isolated_systems(base_stations)
+    iso_systems = util.isolated_systems(state.catalogue)
 
-    active_base_stations = util.active_base_stations(base_stations)
+    active_base_stations = util.active_base_stations(state)
 
     avg_snr = util.snr_averages(ue)
 
-    connected_UE_BS = util.connected_ue_bs(base_stations)
+    connected_UE_BS = util.connected_ue_bs(state, ue)
 
-    active_channels = util.active_channels(base_stations)
+    active_channels = util.active_channels(state)
 
     return iso_users, percentage_received_service, percentage_received_service_half, average_distance_to_bs, iso_systems, active_base_stations, avg_snr, connected_UE_BS, active_channels
 
 
-def reset_all(base_stations, ue):
-    for bs in base_stations:
-        bs.reset()
-
-    for user in ue:
-        user.reset()
+def reset_all(state, ue):
+    state.reset()
+    ue.reset()
 
 
 def load_cities():
@@ -281,7 +747,15 @@ def load_cities():
 
 # TODO add BSs for area larger than city?
 # TODO create mmwave basestations
-def load_bs(city):
+def load_bs(city, rng=None, mmwave_probability=None):
+    """
+    Loads the base stations within a city
+    :param city: the city
+    :param rng: numpy Generator for the mmWave channels, the global random state when None
+    :param mmwave_probability: probability that a base station has a mmWave channel,
+    settings.MMWAVE_PROBABILITY when None
+    :return: list of base stations
+    """
     min_lat, min_lon, max_lat, max_lon = city.min_lat, city.min_lon, city.max_lat, city.max_lon
     all_basestations = list()
     with open(settings.BS_PATH) as f:
@@ -301,8 +775,9 @@ def load_bs(city):
                 h = bs.get('antennes')[0].get("Hoogte")
                 h = util.str_to_float(h)
                 new_bs = BSO.BaseStation(bs.get('ID'), radio, bs_lon, bs_lat, h,
-                                         City.Area(min_lat, min_lon, max_lat, max_lon))
+                                         City.Area(min_lat, min_lon, max_lat, max_lon), rng, mmwave_probability)
                 new_bs.area = city.area(bs_lon, bs_lat)
+                new_bs.index = len(all_basestations)
                 for antenna in bs.get("antennes"):
                     f = util.str_to_float(antenna.get("Frequentie"))
                     p = util.dbw_to_dbm(util.str_to_float(antenna.get("Vermogen")))
@@ -313,4 +788,13 @@ def load_bs(city):
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Simulates the resilience of the mobile networks of the cities")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue the run in settings.CHECKPOINT_PATH, skipping the tasks that are finished")
+    parser.add_argument('--grid', type=json.loads, default=None,
+                        help="JSON object with the values of the scenario parameters to simulate every combination of, "
+                             "for example '{\"MMWAVE_PROBABILITY\": [0, 0.5, 1]}', settings.SCENARIOS when not given")
+    parser.add_argument('--overwrite', action='store_true',
+                        help="start a new run even though the run in settings.CHECKPOINT_PATH is unfinished")
+    args = parser.parse_args()
+    main(args.resume, args.grid, args.overwrite)
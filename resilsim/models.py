@@ -224,6 +224,292 @@ def received_power(radio, tx, params, g_tx=settings.G_TX, g_rx=settings.G_RX):
         return util.to_pwr(tx - pathloss_nr(params) + g_tx + g_rx)
 
 
+def los_probability_batch(d_2d, area, ue_h):
+    """
+    Vectorized version of los_probability
+    :param d_2d: array of 2d distances
+    :param area: array of area type values (util.AreaType.value)
+    :param ue_h: UE height(s)
+    :return: array with the probability of LoS condition
+    """
+    d_2d, area, ue_h = np.broadcast_arrays(np.asarray(d_2d, dtype=float), np.asarray(area), np.asarray(ue_h, dtype=float))
+    rma = area == util.AreaType.RMA.value
+    uma = area == util.AreaType.UMA.value
+    umi = area == util.AreaType.UMI.value
+    if not np.all(rma | uma | umi):
+        raise TypeError("Unknown area type")
+
+    prob = np.ones(d_2d.shape)
+    m = rma & (d_2d > 10)
+    prob[m] = np.exp(-((d_2d[m] - 10) / 1000))
+    m = uma & (d_2d > 18)
+    d = d_2d[m]
+    prob[m] = 18 / d + np.exp(-d / 36) * (1 - 18 / d)
+    m = umi & (d_2d > 18)
+    if np.any(ue_h[m] > 23):
+        raise ValueError("LoS probability model does not function for height larger than 23m")
+    d = d_2d[m]
+    h = ue_h[m]
+    c = np.where(h <= 13, 0, ((np.maximum(h, 13) - 13) / 10) ** 1.5)
+    prob[m] = (18 / d + np.exp(-d / 63) * (1 - 18 / d)) * (1 + c * (5 / 4) * (d / 100) * np.exp(-d / 150))
+    return prob
+
+
+def pathloss_urban_los_batch(d_2d, d_3d, f, ue_h, bs_h, a, b, c):
+    """
+    Vectorized version of pathloss_urban_los, all parameters can be arrays
+    :return: array with the path loss in dB
+    """
+    d_2d, d_3d, f, ue_h, bs_h, a, b, c = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                                               (d_2d, d_3d, f, ue_h, bs_h, a, b, c)])
+    pl = np.full(d_2d.shape, float(settings.MCL))
+    bp = breakpoint_distance(f, bs_h, ue_h)
+    if np.any((d_2d > 5000) & (d_2d > bp)):
+        raise ValueError("Pathloss urban los model does not function for d_2d>5km")
+    m = (d_2d >= 10) & (d_2d <= bp)
+    pl[m] = a[m] + b[m] * np.log10(d_3d[m]) + 20 * np.log10(f[m])
+    m = (d_2d >= 10) & (d_2d > bp)
+    pl[m] = a[m] + 40 * np.log10(d_3d[m]) + 20 * np.log10(f[m]) \
+            - c[m] * np.log10(bp[m] ** 2 + (bs_h[m] - ue_h[m]) ** 2)
+    return pl
+
+
+def pathloss_rma_los_pl1_batch(distance, avg_building_height, frequency):
+    """
+    Vectorized version of pathloss_rma_los_pl1
+    """
+    a = 40 * math.pi * distance * frequency / 3
+    hp = avg_building_height ** 1.72
+    return 20 * np.log10(a) + np.minimum(0.03 * hp, 10) * np.log10(distance) - np.minimum(0.044 * hp, 14.77) + \
+           0.002 * np.log10(avg_building_height) * distance
+
+
+def _pathloss_nr_terms(d_2d, d_3d, los, f, bs_h, ue_h, area, hb, w):
+    """
+    Splits the 5G path loss of every link in deterministic parts and shadow fading deviations such that
+    path-loss = max(los_pl + shadow_fading(los_sd), nlos_pl) + shadow_fading(sd)
+    A deviation of NaN means no shadow fading is added.
+    :return: tuple (los_pl, los_sd, nlos_pl, sd) of arrays
+    """
+    n = d_2d.shape
+    los_pl = np.full(n, float(settings.MCL))
+    los_sd = np.full(n, np.nan)
+    nlos_pl = np.full(n, -np.inf)
+    sd = np.full(n, np.nan)
+    atm = np.broadcast_to(atmospheric_attenuation(f, d_2d), n)
+
+    uma = area == util.AreaType.UMA.value
+    umi = area == util.AreaType.UMI.value
+    rma = area == util.AreaType.RMA.value
+    if not np.all(uma | umi | rma):
+        raise ValueError("Unknown area type")
+
+    # Urban macro and micro cells, parameters differ per area
+    urban = uma | umi
+    if np.any(urban):
+        u_d_2d, u_d_3d, u_f, u_ue_h, u_bs_h = d_2d[urban], d_3d[urban], f[urban], ue_h[urban], bs_h[urban]
+        u_uma = uma[urban]
+        pl_los = pathloss_urban_los_batch(u_d_2d, u_d_3d, u_f, u_ue_h, u_bs_h,
+                                          np.where(u_uma, 28, 32.4), np.where(u_uma, 22, 21), np.where(u_uma, 9, 9.5))
+        pl_nlos = np.where(u_uma,
+                           pathloss_urban_nlos(u_d_3d, u_f, u_ue_h, 13.54, 39.08, 20, 0.6),
+                           pathloss_urban_nlos(u_d_3d, u_f, u_ue_h, 22.4, 35.3, 21.3, 0.3))
+        u_los, u_atm = los[urban], atm[urban]
+        los_pl[urban] = pl_los + u_atm
+        nlos_pl[urban] = np.where(u_los, -np.inf, pl_nlos + u_atm)
+        sd[urban] = np.where(u_los, 4, np.where(u_uma, 6, 7.82))
+
+    # Rural macro cells
+    if np.any(rma):
+        r_d_2d, r_d_3d, r_f, r_bs_h, r_ue_h = d_2d[rma], d_3d[rma], f[rma], bs_h[rma], ue_h[rma]
+        r_hb, r_w, r_los, r_atm = hb[rma], w[rma], los[rma], atm[rma]
+        if np.any(r_los & (r_d_2d > 10000)):
+            raise ValueError("LoS model for RMa does not function for d_2D>10km")
+        if np.any(~r_los & (r_d_2d > 5000)):
+            raise ValueError("NLoS model for RMa does not function for d_2D>5km")
+        bp = breakpoint_distance(r_f, r_bs_h)
+        near = r_d_2d < 10
+        before_bp = ~near & (r_d_2d <= bp)
+        after_bp = ~near & ~before_bp
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pl_los = np.where(before_bp,
+                              pathloss_rma_los_pl1_batch(r_d_3d, r_hb, r_f),
+                              pathloss_rma_los_pl1_batch(bp, r_hb, r_f) + 40 * np.log10(r_d_3d / bp))
+            pl_los = pl_los + r_atm
+            pl_nlos = 161.04 - 7.1 * np.log10(r_w) + 7.5 * np.log10(r_hb) \
+                      - (24.37 - 3.7 * (r_hb / r_bs_h) ** 2) * np.log10(r_bs_h) \
+                      + (43.42 - 3.1 * np.log10(r_bs_h)) * (np.log10(r_d_3d) - 3) \
+                      + 20 * np.log10(r_f) - (3.2 * np.log10(11.75 * r_ue_h) - 4.97)
+        los_sd_rma = np.where(before_bp, 4, 6)
+
+        r_los_pl = np.full(r_d_2d.shape, float(settings.MCL))
+        r_los_sd = np.full(r_d_2d.shape, np.nan)
+        r_nlos_pl = np.full(r_d_2d.shape, -np.inf)
+        r_sd = np.full(r_d_2d.shape, np.nan)
+        # LoS
+        m = r_los & ~near
+        r_los_pl[m] = pl_los[m]
+        r_sd[m] = los_sd_rma[m]
+        # NLoS, takes the maximum with the full LoS path loss (including its shadow fading)
+        m = ~r_los & ~near
+        r_los_pl[m] = pl_los[m] + r_atm[m]
+        r_los_sd[m] = los_sd_rma[m]
+        r_nlos_pl[m] = pl_nlos[m] + r_atm[m]
+        r_sd[m] = 8
+
+        los_pl[rma] = r_los_pl
+        los_sd[rma] = r_los_sd
+        nlos_pl[rma] = r_nlos_pl
+        sd[rma] = r_sd
+
+    return los_pl, los_sd, nlos_pl, sd
+
+
+def pathloss_nr_batch(d_2d, d_3d, los, frequency, bs_height, ue_height, area, avg_building_height,
+                      avg_street_width):
+    """
+    Vectorized version of pathloss_nr, all parameters are arrays (or scalars) with one entry per link
+    :param los: LoS condition per link
+    :param frequency: frequency in GHz
+    :param area: area type value (util.AreaType.value) per link
+    :return: The path-loss in dB per link
+    """
+    d_2d, d_3d, los, frequency, bs_height, ue_height, area, avg_building_height, avg_street_width = \
+        np.broadcast_arrays(np.asarray(d_2d, dtype=float), np.asarray(d_3d, dtype=float),
+                            np.asarray(los, dtype=bool), np.asarray(frequency, dtype=float),
+                            np.asarray(bs_height, dtype=float), np.asarray(ue_height, dtype=float),
+                            np.asarray(area), np.asarray(avg_building_height, dtype=float),
+                            np.asarray(avg_street_width, dtype=float))
+    los_pl, los_sd, nlos_pl, sd = _pathloss_nr_terms(d_2d, d_3d, los, frequency, bs_height, ue_height, area,
+                                                     avg_building_height, avg_street_width)
+    return np.maximum(los_pl + shadow_fading_batch(los_sd), nlos_pl) + shadow_fading_batch(sd)
+
+
+def pathloss_lte_batch(d_2d, frequency, rng=None):
+    """
+    Vectorized version of pathloss_lte
+    :param d_2d: 2d distance per link
+    :param frequency: frequency in MHz per link
+    :param rng: RandomStream for the random term, the global numpy random state when None
+    :return: path-loss in dBW per link
+    """
+    mean = _pathloss_lte_mean(d_2d, frequency)
+    if rng is None:
+        return mean + math.sqrt(10) * np.random.random(mean.shape)
+    return mean + math.sqrt(10) * rng.random(mean.size).reshape(mean.shape)
+
+
+def _pathloss_lte_mean(d_2d, frequency):
+    """
+    Deterministic part of the LTE path loss, pathloss_lte adds a uniform term between 0 and sqrt(10)
+    :return: path-loss in dBW per link
+    """
+    d_2d, frequency = np.broadcast_arrays(np.asarray(d_2d, dtype=float), np.asarray(frequency, dtype=float))
+    hab = settings.HEIGHT_ABOVE_BUILDINGS
+    MODEL_A = -18 * np.log10(hab) + 21 * np.log10(frequency) + 80
+    MODEL_B = 40 * (1 - 4 * (10 ** -3) * hab)
+    with np.errstate(divide='ignore'):
+        return MODEL_A + MODEL_B * np.log10(d_2d / 1000)
+
+
+def shadow_fading_batch(sd, rng=None):
+    """
+    Vectorized version of shadow_fading
+    :param sd: the standard deviation per link, NaN when no shadow fading applies
+    :param rng: RandomStream to draw from, the global numpy random state when None
+    :return: array of shadow fading values (0 where sd is NaN)
+    """
+    sd = np.asarray(sd, dtype=float)
+    res = np.zeros(sd.shape)
+    m = ~np.isnan(sd)
+    if rng is None:
+        res[m] = np.random.lognormal(0, sd[m])
+    else:
+        # Lognormal with mean 0 of the underlying normal distribution
+        res[m] = np.exp(sd[m] * rng.standard_normal(np.count_nonzero(m)))
+    return res
+
+
+# Terms of a link budget, see link_budget_batch
+LINK_BUDGET_TERMS = ('lte', 'tx', 'los_pl', 'los_sd', 'nlos_pl', 'sd')
+
+
+def link_budget_batch(radio, tx, d_2d, d_3d, frequency, area, bs_height=settings.HEIGHT_ABOVE_BUILDINGS,
+                      ue_height=settings.UE_HEIGHT, avg_building_height=settings.AVG_BUILDING_HEIGHT,
+                      avg_street_width=settings.AVG_STREET_WIDTH):
+    """
+    Calculates the deterministic part of the link budget of many links, these do not change between rounds.
+    received_power_from_budget adds the random terms.
+    All parameters are arrays (or scalars) with one entry per link, see received_power_batch
+    :return: dictionary with an array per name in LINK_BUDGET_TERMS: lte (LTE link), tx (transmitted power in dBm),
+    los_pl, los_sd, nlos_pl and sd (path loss terms of _pathloss_nr_terms, los_pl is the mean path loss for LTE)
+    """
+    radio, tx, d_2d, d_3d, frequency, area, bs_height, ue_height, avg_building_height, avg_street_width = \
+        np.broadcast_arrays(np.asarray(radio), np.asarray(tx, dtype=float), np.asarray(d_2d, dtype=float),
+                            np.asarray(d_3d, dtype=float), np.asarray(frequency, dtype=float), np.asarray(area),
+                            np.asarray(bs_height, dtype=float), np.asarray(ue_height, dtype=float),
+                            np.asarray(avg_building_height, dtype=float), np.asarray(avg_street_width, dtype=float))
+    lte = radio == util.BaseStationRadioType.LTE.value
+    nr = radio == util.BaseStationRadioType.NR.value
+    if not np.all(lte | nr):
+        raise ValueError("Unknown radio type")
+
+    budget = {'lte': lte, 'tx': tx.copy(), 'los_pl': np.empty(radio.shape), 'los_sd': np.full(radio.shape, np.nan),
+              'nlos_pl': np.full(radio.shape, -np.inf), 'sd': np.full(radio.shape, np.nan)}
+    if np.any(lte):
+        budget['los_pl'][lte] = _pathloss_lte_mean(d_2d[lte], frequency[lte])
+    if np.any(nr):
+        # Models use GHz; as in received_power the LoS probability itself is used as the LoS condition
+        los = los_probability_batch(d_2d[nr], area[nr], ue_height[nr]) != 0
+        terms = _pathloss_nr_terms(d_2d[nr], d_3d[nr], los, frequency[nr] / 1000, bs_height[nr], ue_height[nr],
+                                   area[nr], avg_building_height[nr], avg_street_width[nr])
+        for name, term in zip(('los_pl', 'los_sd', 'nlos_pl', 'sd'), terms):
+            budget[name][nr] = term
+    return budget
+
+
+def received_power_from_budget(budget, g_tx=settings.G_TX, g_rx=settings.G_RX, rng=None):
+    """
+    Draws the random terms of many links in bulk and adds them to their link budgets
+    :param budget: link budgets, see link_budget_batch
+    :param rng: RandomStream to draw from, the global numpy random state when None
+    :return: power received in mW
+    """
+    lte = budget['lte']
+    nr = ~lte
+    tx = budget['tx']
+    pwr = np.empty(lte.shape)
+    if np.any(lte):
+        uniform = np.random.random(np.count_nonzero(lte)) if rng is None else rng.random(np.count_nonzero(lte))
+        pl = budget['los_pl'][lte] + math.sqrt(10) * uniform
+        pwr[lte] = util.to_pwr(tx[lte] - np.maximum(pl - settings.G_TX - settings.G_RX, settings.MCL))
+    if np.any(nr):
+        pl = np.maximum(budget['los_pl'][nr] + shadow_fading_batch(budget['los_sd'][nr], rng), budget['nlos_pl'][nr]) \
+             + shadow_fading_batch(budget['sd'][nr], rng)
+        pwr[nr] = util.to_pwr(tx[nr] - pl + g_tx + g_rx)
+    return pwr
+
+
+def received_power_batch(radio, tx, d_2d, d_3d, frequency, area, bs_height=settings.HEIGHT_ABOVE_BUILDINGS,
+                         ue_height=settings.UE_HEIGHT, avg_building_height=settings.AVG_BUILDING_HEIGHT,
+                         avg_street_width=settings.AVG_STREET_WIDTH, g_tx=settings.G_TX, g_rx=settings.G_RX, rng=None):
+    """
+    Calculates the power received for many links at once, gives the same results as received_power
+    All parameters are arrays (or scalars) with one entry per link
+    :param radio: radio type value (util.BaseStationRadioType.value)
+    :param tx: transmitted power in dBm
+    :param d_2d: 2d distance
+    :param d_3d: 3d distance
+    :param frequency: frequency in MHz
+    :param area: area type value (util.AreaType.value)
+    :param rng: RandomStream for the random terms, the global numpy random state when None
+    :return: power received in mW
+    """
+    budget = link_budget_batch(radio, tx, d_2d, d_3d, frequency, area, bs_height, ue_height, avg_building_height,
+                               avg_street_width)
+    return received_power_from_budget(budget, g_tx, g_rx, rng)
+
+
 def snr(power, noise=settings.SIGNAL_NOISE):
     """
     Calculates signal to noise ratio
@@ -253,6 +539,26 @@ def shannon_second_param(snr):
     return math.log2(1 + snr)
 
 
+def bandwidth_needed(capacity, snr):
+    """
+    Calculates the bandwidth of a channel that is needed to satisfy the requested capacity
+    :param capacity: requested capacity
+    :param snr: signal-to-noise ratio
+    :return: smallest needed bandwidth chosen from settings.CHANNEL_BANDWIDTHS
+    such that the full requested capacity is used
+    """
+    # TODO potential for division by 0
+    needed = capacity / shannon_second_param(snr)
+    needed_bandwidth = settings.CHANNEL_BANDWIDTHS[0]  # maximum bandwidth for a channel
+    for bandwidth in settings.CHANNEL_BANDWIDTHS:
+        if needed > bandwidth:
+            break
+        else:
+            needed_bandwidth = bandwidth
+
+    return needed_bandwidth
+
+
 def beamforming():
     """
     Simplistic model for beamforming
@@ -0,0 +1,138 @@
+import heapq
+
+import numpy as np
+
+
+class Baseline:
+    """
+    Association of a UE population without failures, used to reconnect the UEs after a failure (delta reconnection).
+    Every UE connects to the first candidate that accepts it, in the order of the UEs (see main.connect_ue_bs).
+    A base station whose state is the same as in the baseline at the time a UE tries it gives the same answer,
+    so only the UEs that try a failed or changed (dirty) base station are connected again.
+    A base station becomes dirty when a UE tries it that did not in the baseline, or the other way around.
+    Its state is then rebuilt by repeating the baseline attempts on it before that UE.
+    The received powers are drawn once per population (LinkBudget.fixed_power), with the same powers
+    the result equals connect_ue_bs on the failed network.
+    """
+
+    def __init__(self, ue, state, candidates, budget, seed):
+        """
+        Connects the UEs to the network without failures, the state and UEs are reset before and after
+        :param ue: population of UEs
+        :param state: state of the channels of the base stations
+        :param candidates: base stations in range of each UE
+        :param budget: cached link budgets of the candidates
+        :param seed: SeedSequence of the population, used for the received powers
+        """
+        self.candidates = candidates
+        self.budget = budget
+        self.seed = seed
+
+        state.reset()
+        ue.reset()
+        self.tried = np.zeros(len(ue), dtype=int)  # number of candidates tried by each UE
+        self.accepted = np.full(len(ue), -1, dtype=int)  # rank of the accepting candidate, -1 when none
+        self.attempts = [[] for _ in range(len(state.catalogue))]  # UEs that tried each base station, in order
+        for k in range(len(candidates)):
+            for rank, p in enumerate(range(candidates.indptr[k], candidates.indptr[k + 1])):
+                i = candidates.bs[p]
+                self.attempts[i].append(k)
+                self.tried[k] = rank + 1
+                if state.add_ue(ue, k, i, float(candidates.d_2d[p]), self.power(p)):
+                    self.accepted[k] = rank
+                    break
+
+        # State at the end of the association
+        self.channel_state = {name: getattr(state, name).copy() for name in
+                              ('devices', 'tier_count', 'desired_count', 'band_used', 'band_desired')}
+        self.zero_count = state.zero_count.copy()
+        self.ue_state = {name: getattr(state, name).copy() for name in ('ue_channel', 'ue_tier', 'ue_desired')}
+        self.angles = {c: list(angles) for c, angles in state.angles.items()}
+        self.connection = {name: getattr(ue, name).copy() for name in ('bs', 'channel', 'power', 'snr', 'distance')}
+        state.reset()
+        ue.reset()
+
+    def power(self, p):
+        """
+        :param p: position of the link in the candidate arrays
+        :return: array with the power in mW on each channel of the base station of the link
+        """
+        return self.budget.fixed_power(p, self.seed)
+
+    def reconnect(self, state, ue):
+        """
+        Connects the UEs to the failed network, gives the same state as connect_ue_bs with the baseline powers
+        :param state: state of the channels after reset and failure
+        :param ue: population of UEs after reset
+        :return: None
+        """
+        candidates = self.candidates
+        catalogue = state.catalogue
+        alive = state.alive_stations()
+        dirty = np.zeros(len(catalogue), dtype=bool)
+        pending = []  # UEs to connect again
+        done = np.zeros(len(ue), dtype=bool)
+
+        def make_dirty(i, k):
+            # Rebuilds base station i with the baseline attempts before UE k, the attempts after k are repeated
+            dirty[i] = True
+            for k2 in self.attempts[i]:
+                if k2 < k:
+                    p = candidates.indptr[k2] + self._rank(k2, i)
+                    state.add_ue(ue, k2, i, float(candidates.d_2d[p]), self.power(p))
+                elif k2 > k:
+                    heapq.heappush(pending, k2)
+
+        # Base stations with a failed channel
+        failed = state.available & ~state.enabled
+        for i in np.flatnonzero(np.bincount(catalogue.ch_bs[failed], minlength=len(catalogue))):
+            make_dirty(i, -1)
+
+        while pending:
+            k = heapq.heappop(pending)
+            if done[k]:
+                continue
+            done[k] = True
+            last = candidates.indptr[k + 1] - candidates.indptr[k] - 1
+            for rank, p in enumerate(range(candidates.indptr[k], candidates.indptr[k + 1])):
+                i = candidates.bs[p]
+                if dirty[i]:
+                    if not alive[i]:
+                        continue
+                    connected = state.add_ue(ue, k, i, float(candidates.d_2d[p]), self.power(p))
+                elif rank < self.tried[k]:
+                    connected = rank == self.accepted[k]
+                else:
+                    make_dirty(i, k)
+                    connected = state.add_ue(ue, k, i, float(candidates.d_2d[p]), self.power(p))
+                if connected:
+                    last = rank
+                    break
+            # Base stations the UE tried in the baseline but not now
+            for rank in range(last + 1, self.tried[k]):
+                i = candidates.bs[candidates.indptr[k] + rank]
+                if not dirty[i]:
+                    make_dirty(i, k)
+
+        # Everything connected to a clean base station is as in the baseline
+        clean = ~dirty[catalogue.ch_bs]
+        for name, values in self.channel_state.items():
+            getattr(state, name)[clean] = values[clean]
+        state.zero_count[~dirty] = self.zero_count[~dirty]
+        for c, angles in self.angles.items():
+            if clean[c]:
+                state.angles[c] = list(angles)
+        channel = self.ue_state['ue_channel']
+        moved = channel >= 0
+        moved[moved] = clean[channel[moved]]
+        for name, values in self.ue_state.items():
+            getattr(state, name)[moved] = values[moved]
+        for name, values in self.connection.items():
+            getattr(ue, name)[moved] = values[moved]
+
+    def _rank(self, k, i):
+        """
+        :return: the rank of base station i among the candidates of UE k
+        """
+        start = self.candidates.indptr[k]
+        return int(np.flatnonzero(self.candidates.bs[start:start + self.tried[k]] == i)[0])
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+class Candidates:
+    """
+    Base stations in range of every UE of a population, stored in compressed sparse row form.
+    The candidates of UE k are found at indptr[k]:indptr[k + 1], sorted from closest to farthest.
+    The UEs do not move, so the candidates are built once per population and reused by every round.
+    """
+
+    def __init__(self, index, catalogue, ue):
+        """
+        :param index: spatial index over the base stations
+        :param catalogue: static properties of the base stations
+        :param ue: population of UEs
+        """
+        self.indptr, bs, d_2d = index.query(ue.lon, ue.lat)
+        self.bs = bs.astype(int)
+        self.d_2d = d_2d.astype(float)
+        counts = np.diff(self.indptr)
+        ue_of = np.repeat(np.arange(len(ue)), counts)
+        self.d_3d = np.sqrt(self.d_2d ** 2 + np.abs(catalogue.bs_height[self.bs] - ue.height[ue_of]) ** 2)
+        self.height = ue.height[ue_of]
+        self.rank_of = np.arange(len(self.bs)) - self.indptr[ue_of]  # rank of each candidate of its UE
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def counts(self):
+        """
+        :return: number of candidates of each UE
+        """
+        return np.diff(self.indptr)
+
+    def rank(self, rank, first=0):
+        """
+        Gets the rank-th closest candidate of each UE that has one
+        :param rank: which candidate to use (0 is the closest)
+        :param first: the first UE to include
+        :return: tuple (UE indices, positions in the candidate arrays)
+        """
+        ue_indices = first + np.flatnonzero(self.counts()[first:] > rank)
+        return ue_indices, self.indptr[ue_indices] + rank
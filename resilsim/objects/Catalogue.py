@@ -0,0 +1,151 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+import resilsim.models as models
+import resilsim.settings as settings
+
+
+class Catalogue:
+    """
+    Static properties of the base stations of a city and their channels, stored in arrays.
+    The channels of base station i are found at ch_start[i]:ch_start[i + 1], in the order of BaseStation.channels
+    The arrays can be placed in shared memory so worker processes use them without a private copy.
+    """
+    ARRAYS = ('bs_lon', 'bs_lat', 'bs_height', 'bs_radio', 'bs_area', 'bs_building_height', 'bs_street_width',
+              'bs_mmwave_draw', 'ch_start', 'ch_bs', 'ch_frequency', 'ch_power', 'ch_beamforming', 'link_a', 'link_b')
+
+    def __init__(self, base_stations):
+        self.bs_lon = np.array([bs.lon for bs in base_stations], dtype=float)
+        self.bs_lat = np.array([bs.lat for bs in base_stations], dtype=float)
+        self.bs_height = np.array([bs.height for bs in base_stations], dtype=float)
+        self.bs_radio = np.array([bs.radio.value if bs.radio is not None else 0 for bs in base_stations], dtype=int)
+        self.bs_area = np.array([bs.area.area_type.value for bs in base_stations], dtype=int)
+        self.bs_building_height = np.array([bs.area.avg_building_height for bs in base_stations], dtype=float)
+        self.bs_street_width = np.array([bs.area.avg_street_width for bs in base_stations], dtype=float)
+        self.bs_mmwave_draw = np.array([bs.mmwave_draw for bs in base_stations], dtype=float)
+
+        channels = [c for bs in base_stations for c in bs.channels]
+        counts = [len(bs.channels) for bs in base_stations]
+        self.ch_start = np.zeros(len(base_stations) + 1, dtype=int)
+        self.ch_start[1:] = np.cumsum(counts)
+        self.ch_bs = np.repeat(np.arange(len(base_stations)), counts)
+        self.ch_frequency = np.array([c.frequency for c in channels], dtype=float)
+        self.ch_power = np.array([c.power for c in channels], dtype=float)
+        self.ch_beamforming = np.array([c.beamforming for c in channels], dtype=bool)
+
+        # Links between base stations as pairs of indices
+        position = {id(bs): i for i, bs in enumerate(base_stations)}
+        links = [(position[id(link.device1)], position[id(link.device2)])
+                 for bs in base_stations for link in bs.connected_BS if link.device1 is bs]
+        self.link_a = np.array([a for a, _ in links], dtype=int)
+        self.link_b = np.array([b for _, b in links], dtype=int)
+        self.shm = None
+        self._systems = None
+
+    def to_shared_memory(self):
+        """
+        Copies the arrays of the catalogue into one shared memory block
+        :return: tuple (SharedMemory, layout), the caller closes and unlinks the block when done
+        """
+        layout = dict()
+        size = 0
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            size += -size % 8  # align every array on 8 bytes
+            layout[name] = (size, array.dtype.str, array.shape)
+            size += array.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, (offset, dtype, shape) in layout.items():
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = getattr(self, name)
+        return shm, layout
+
+    @classmethod
+    def from_shared_memory(cls, name, layout):
+        """
+        Attaches to a catalogue created by to_shared_memory, the arrays are read-only views on the shared block
+        :param name: name of the shared memory block
+        :param layout: layout returned by to_shared_memory
+        :return: the catalogue
+        """
+        catalogue = cls.__new__(cls)
+        catalogue.shm = shared_memory.SharedMemory(name=name)
+        catalogue._systems = None
+        for attr, (offset, dtype, shape) in layout.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=catalogue.shm.buf, offset=offset)
+            array.flags.writeable = False
+            setattr(catalogue, attr, array)
+        return catalogue
+
+    def __len__(self):
+        return len(self.bs_lon)
+
+    @property
+    def channel_count(self):
+        return len(self.ch_frequency)
+
+    def mmwave_disabled(self, probability):
+        """
+        :param probability: probability of a base station to have a mmWave channel in a scenario
+        :return: boolean array, True for the mmWave channels the base stations do not have in the scenario
+        """
+        return self.ch_beamforming & (self.bs_mmwave_draw[self.ch_bs] >= probability)
+
+    def systems(self):
+        """
+        Finds the connected components of the links between the base stations, computed once as the links never change
+        :return: tuple (number of components, component label of each base station)
+        """
+        if self._systems is None:
+            graph = coo_matrix((np.ones(len(self.link_a)), (self.link_a, self.link_b)), shape=(len(self), len(self)))
+            self._systems = connected_components(graph, directed=False)
+        return self._systems
+
+    def received_power(self, bs_indices, distances, ue_height=settings.UE_HEIGHT, d_3d=None, rng=None):
+        """
+        Calculates the received power on every channel of the given base stations in one batch
+        :param bs_indices: base station index per link
+        :param distances: 2d distance per link
+        :param ue_height: height of the UE (per link)
+        :param d_3d: 3d distance per link, calculated when None
+        :param rng: RandomStream for the random terms, the global numpy random state when None
+        :return: tuple (power, offsets), the power in mW of link p on channel c of its base station
+        is power[offsets[p] + c]
+        """
+        budget, offsets = self.link_budget(bs_indices, distances, ue_height, d_3d)
+        return models.received_power_from_budget(budget, rng=rng), offsets
+
+    def link_budget(self, bs_indices, distances, ue_height=settings.UE_HEIGHT, d_3d=None):
+        """
+        Calculates the deterministic link budget on every channel of the given base stations in one batch
+        :param bs_indices: base station index per link
+        :param distances: 2d distance per link
+        :param ue_height: height of the UE (per link)
+        :param d_3d: 3d distance per link, calculated when None
+        :return: tuple (budget, offsets), the terms of link p on channel c of its base station are found at
+        offsets[p] + c of each array in budget, see models.link_budget_batch
+        """
+        bs_indices = np.asarray(bs_indices, dtype=int)
+        distances = np.asarray(distances, dtype=float)
+        ue_height = np.broadcast_to(np.asarray(ue_height, dtype=float), bs_indices.shape)
+
+        counts = self.ch_start[bs_indices + 1] - self.ch_start[bs_indices]
+        offsets = np.zeros(len(bs_indices) + 1, dtype=int)
+        offsets[1:] = np.cumsum(counts)
+        link = np.repeat(np.arange(len(bs_indices)), counts)
+        channel = np.arange(offsets[-1]) - offsets[link] + self.ch_start[bs_indices][link]
+
+        bs = bs_indices[link]
+        d_2d = distances[link]
+        h = ue_height[link]
+        if d_3d is None:
+            d_3d = np.sqrt(d_2d ** 2 + np.abs(self.bs_height[bs] - h) ** 2)
+        else:
+            d_3d = np.asarray(d_3d, dtype=float)[link]
+        budget = models.link_budget_batch(self.bs_radio[bs], self.ch_power[channel], d_2d, d_3d,
+                                          self.ch_frequency[channel], self.bs_area[bs], ue_height=h,
+                                          avg_building_height=self.bs_building_height[bs],
+                                          avg_street_width=self.bs_street_width[bs])
+        return budget, offsets
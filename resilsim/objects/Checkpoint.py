@@ -0,0 +1,143 @@
+import json
+import os
+
+import numpy as np
+
+import resilsim.settings as settings
+from resilsim.objects.Metrics import Metrics
+
+# Settings that do not change the result of a task, they may differ when a run is resumed.
+# The scenarios are part of the names of the jobs
+RUN_SETTINGS = ('AMOUNT_THREADS', 'SEED', 'CHECKPOINT_PATH', 'SAVE_IN_CSV', 'SAVE_CSV_PATH', 'SAVE_IN_STORE',
+                'SAVE_STORE_PATH', 'CREATE_PLOT', 'LINK_BUDGET_CACHE_SIZE', 'ADAPTIVE_MAX_ROUNDS', 'ADAPTIVE_MAX_TIME',
+                'SCENARIOS')
+# Columns of a result row, followed by the metrics
+COLUMNS = ('u', 'task_severity', 'r', 'remaining', 'severity')
+
+
+def run_settings():
+    """
+    :return: Dict(String: String) the settings that determine the results of the tasks
+    """
+    return {name: repr(getattr(settings, name)) for name in dir(settings)
+            if name.isupper() and not name.endswith('_DIR') and name not in RUN_SETTINGS}
+
+
+class Checkpoint:
+    """
+    Results of the finished tasks of a run, appended to a file per job (a city in a scenario) as soon as a task
+    finishes, so an interrupted run can be resumed without simulating those tasks again.
+    A task is identified by its job, round per user, severity and round; its seed follows from the seed of the run,
+    which is stored in the manifest together with the settings of the run.
+    Every row holds the task, the number of rows of the task after it, the severity and the metrics.
+    A task without results (nothing failed) has one row with severity -1, a task of a radius sweep has severity -1.
+    Rows of a task that was not written completely are discarded when resuming
+    """
+
+    def __init__(self, path, jobs, entropy, resume=False, overwrite=False):
+        """
+        :param path: directory of the checkpoint
+        :param jobs: the names of the jobs of the run
+        :param entropy: entropy of the seed of the run, replaced by the stored entropy when resuming
+        :param resume: continue the run stored in the directory, otherwise the directory is overwritten
+        :param overwrite: overwrite the checkpoint of an unfinished run, otherwise starting a new run over it
+        raises a ValueError
+        """
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        self.finished = [dict() for _ in jobs]  # results by (u, severity, r) of the restored tasks of each job
+        self.manifest = {'entropy': entropy, 'jobs': list(jobs), 'settings': run_settings(), 'complete': False}
+        if resume:
+            with open(self.manifest_path) as f:
+                stored = json.load(f)
+            if stored.get('jobs') != self.manifest['jobs']:
+                raise ValueError(f"Checkpoint in {path} is of the jobs {stored.get('jobs')}")
+            changed = sorted(name for name in set(stored['settings']) | set(self.manifest['settings'])
+                             if stored['settings'].get(name) != self.manifest['settings'].get(name))
+            if len(changed) > 0:
+                raise ValueError(f"Checkpoint in {path} was made with other settings: {', '.join(changed)}")
+            self.entropy = stored['entropy']
+            self.manifest['entropy'] = self.entropy
+            for j in range(len(jobs)):
+                self.finished[j] = self._restore(j)
+            self.files = [open(self._job_path(j), 'ab') for j in range(len(jobs))]
+        else:
+            if not overwrite and os.path.exists(self.manifest_path):
+                with open(self.manifest_path) as f:
+                    if not json.load(f).get('complete', False):
+                        raise ValueError(f"Checkpoint in {path} is of an unfinished run, "
+                                         f"continue it with --resume or start over with --overwrite")
+            os.makedirs(path, exist_ok=True)
+            self.entropy = entropy
+            self.files = [open(self._job_path(j), 'wb') for j in range(len(jobs))]
+            self._write_manifest()
+
+    def _write_manifest(self):
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+
+    def _job_path(self, j):
+        return os.path.join(self.path, f"job_{j}.bin")
+
+    def _restore(self, j):
+        """
+        Reads the finished tasks of a job, the file is truncated after the last complete task
+        :param j: index of the job
+        :return: Dict((Int,Int,Int): List((Int, Array))) for each task (u, severity, r) its results
+        """
+        width = len(COLUMNS) + len(Metrics.NAMES)
+        rows = np.fromfile(self._job_path(j), dtype=float)
+        rows = rows[:len(rows) - len(rows) % width].reshape(-1, width)
+        complete = np.flatnonzero(rows[:, 3] == 0)
+        rows = rows[:complete[-1] + 1] if len(complete) > 0 else rows[:0]
+        with open(self._job_path(j), 'r+b') as f:
+            f.truncate(rows.nbytes)
+
+        finished = dict()
+        for row in rows:
+            u, severity, r = (int(x) for x in row[:3])
+            key = (u, None if severity < 0 else severity, r)
+            values = finished.setdefault(key, [])
+            if row[4] >= 0:
+                values.append((int(row[4]), row[len(COLUMNS):]))
+        return finished
+
+    def is_finished(self, j, u, severity, r):
+        """
+        :return: True if the task was finished before the run was resumed
+        """
+        return (u, severity, r) in self.finished[j]
+
+    def add(self, j, u, severity, r, values):
+        """
+        Appends the results of a finished task
+        :param j: index of the job
+        :param u: the round per user
+        :param severity: the severity of the task, None for a radius sweep
+        :param r: the round within the severity
+        :param values: list of tuples (severity, array with the resilience metrics)
+        :return: None
+        """
+        rows = np.full((max(1, len(values)), len(COLUMNS) + len(Metrics.NAMES)), np.nan)
+        rows[:, 0] = u
+        rows[:, 1] = -1 if severity is None else severity
+        rows[:, 2] = r
+        rows[:, 3] = np.arange(len(rows))[::-1]
+        rows[:, 4] = -1
+        for n, (s, v) in enumerate(values):
+            rows[n, 4] = s
+            rows[n, len(COLUMNS):] = v
+        self.files[j].write(rows.tobytes())
+        self.files[j].flush()
+
+    def complete(self):
+        """
+        Marks the run as finished, a new run may overwrite the checkpoint then
+        :return: None
+        """
+        self.manifest['complete'] = True
+        self._write_manifest()
+
+    def close(self):
+        for f in self.files:
+            f.close()
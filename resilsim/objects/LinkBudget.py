@@ -0,0 +1,156 @@
+import numpy as np
+
+import resilsim.models as models
+import resilsim.settings as settings
+from resilsim.objects.RandomStream import RandomStream
+
+# Spawn key of the random stream of the fixed powers, below the seed of the population
+FIXED_POWERS = 2
+
+
+class LinkBudget:
+    """
+    Cache of the deterministic link budgets of the candidate links of a population (see Candidates).
+    Distances, LoS conditions and mean path losses do not change between rounds, only the random terms do.
+    These are drawn in bulk for every batch of links, in the same order as models.received_power_batch.
+    The cache holds at most size channel entries; when it is full the oldest entries are evicted.
+    """
+
+    def __init__(self, catalogue, candidates, size=None):
+        """
+        :param catalogue: static properties of the base stations
+        :param candidates: base stations in range of each UE of the population
+        :param size: maximum number of cached channel entries, settings.LINK_BUDGET_CACHE_SIZE when None
+        """
+        if size is None:
+            size = settings.LINK_BUDGET_CACHE_SIZE
+        self.catalogue = catalogue
+        self.candidates = candidates
+        self.counts = catalogue.ch_start[candidates.bs + 1] - catalogue.ch_start[candidates.bs]
+        self.size = size
+        self.slot = np.full(len(candidates.bs), -1, dtype=int)  # first cache entry of each candidate link
+        self.owner = np.full(size, -1, dtype=int)  # candidate link of each cache entry
+        self.budget = {name: np.empty(size, dtype=bool if name == 'lte' else float)
+                       for name in models.LINK_BUDGET_TERMS}
+        self.next = 0  # next cache entry to fill
+        self.fixed = Powers(self)  # powers drawn by fixed_power
+
+    def received_power(self, positions, rng=None):
+        """
+        Calculates the received power on every channel of the given candidate links
+        :param positions: positions of the links in the candidate arrays
+        :param rng: RandomStream for the random terms, the global numpy random state when None
+        :return: tuple (power, offsets), the power in mW of link p on channel c of its base station
+        is power[offsets[p] + c]
+        """
+        positions = np.asarray(positions, dtype=int)
+        counts = self.counts[positions]
+        offsets = np.zeros(len(positions) + 1, dtype=int)
+        offsets[1:] = np.cumsum(counts)
+        link = np.repeat(np.arange(len(positions)), counts)
+        channel = np.arange(offsets[-1]) - offsets[link]
+
+        budget = {name: np.empty(offsets[-1], dtype=self.budget[name].dtype) for name in models.LINK_BUDGET_TERMS}
+        cached = self.slot[positions] >= 0
+        # Entries of cached links are copied from the cache
+        entries = cached[link]
+        source = self.slot[positions][link][entries] + channel[entries]
+        for name in models.LINK_BUDGET_TERMS:
+            budget[name][entries] = self.budget[name][source]
+        # The other links are calculated and stored
+        missing = positions[~cached]
+        if len(missing) > 0:
+            fresh, _ = self.catalogue.link_budget(self.candidates.bs[missing], self.candidates.d_2d[missing],
+                                                  self.candidates.height[missing], d_3d=self.candidates.d_3d[missing])
+            for name in models.LINK_BUDGET_TERMS:
+                budget[name][~entries] = fresh[name]
+            self.store(missing, fresh)
+
+        return models.received_power_from_budget(budget, rng=rng), offsets
+
+    def fixed_power(self, p, seed):
+        """
+        Gets the received powers of a candidate link, drawn once for the population.
+        The powers of the candidates of a rank are drawn together from their own seed, every call returns the same
+        powers regardless of the rounds simulated before
+        :param p: position of the link in the candidate arrays
+        :param seed: SeedSequence of the population
+        :return: array with the power in mW on each channel of the base station
+        """
+        if not self.fixed.has(p):
+            rank = int(self.candidates.rank_of[p])
+            _, positions = self.candidates.rank(rank)
+            rng = RandomStream(np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (FIXED_POWERS, rank)))
+            self.fixed.add(positions, rng)
+        return self.fixed.get(p)
+
+    def store(self, positions, budget):
+        """
+        Stores the link budgets of links in the cache, evicting the oldest entries when needed
+        :param positions: positions of the links in the candidate arrays
+        :param budget: terms of the links, the entries of a link are consecutive
+        :return: None
+        """
+        counts = self.counts[positions]
+        total = int(counts.sum())
+        if total > self.size:
+            # Does not fit at all, keep the current entries
+            return
+        if self.next + total > self.size:
+            self.next = 0
+        entries = slice(self.next, self.next + total)
+        # Evict the links that start in these entries, left over entries of evicted links are skipped
+        old = self.owner[entries]
+        old = old[old >= 0]
+        old = old[(self.slot[old] >= entries.start) & (self.slot[old] < entries.stop)]
+        self.slot[old] = -1
+
+        starts = np.zeros(len(positions), dtype=int)
+        starts[1:] = np.cumsum(counts)[:-1]
+        self.slot[positions] = self.next + starts
+        self.owner[entries] = np.repeat(positions, counts)
+        for name in models.LINK_BUDGET_TERMS:
+            self.budget[name][entries] = budget[name]
+        self.next += total
+
+
+class Powers:
+    """
+    Received powers of candidate links, calculated in batches of links (see LinkBudget.received_power)
+    and looked up by the position of a link in the candidate arrays
+    """
+
+    def __init__(self, budget):
+        """
+        :param budget: cached link budgets of the candidates
+        """
+        self.budget = budget
+        self.batch = np.full(len(budget.counts), -1, dtype=np.int32)  # batch of each link, -1 when not calculated
+        self.start = np.zeros(len(budget.counts), dtype=np.int32)  # first power of each link in its batch
+        self.power = []  # power of every channel of the links of each batch
+
+    def add(self, positions, rng=None):
+        """
+        Calculates the powers of a batch of links
+        :param positions: positions of the links in the candidate arrays
+        :param rng: RandomStream for the random terms, the global numpy random state when None
+        :return: None
+        """
+        power, offsets = self.budget.received_power(positions, rng)
+        self.batch[positions] = len(self.power)
+        self.start[positions] = offsets[:-1]
+        self.power.append(power)
+
+    def has(self, p):
+        """
+        :return: True if the powers of the link at position p are calculated
+        """
+        return self.batch[p] >= 0
+
+    def get(self, p):
+        """
+        :param p: position of the link in the candidate arrays
+        :return: array with the power in mW on each channel of the base station of the link
+        """
+        start = self.start[p]
+        return self.power[self.batch[p]][start:start + self.budget.counts[p]]
@@ -1,92 +1,68 @@
-import resilsim.util as util
+import numpy as np
+import scipy.stats as st
 
 
 class Metrics:
-    def __init__(self):
-        self.isolated_users = []
-        self.received_service = []
-        self.received_service_half = []
-        self.avg_distance = []
-        self.isolated_systems = []
-        self.active_base_stations = []
-        self.snr = []
-        self.connectedUE_BS = []
-        self.active_channels = []
-
-    def add_metric(self, metrics):
-        self.isolated_users.append(metrics[0])
-
-        self.received_service.append(metrics[1])
-
-        self.received_service_half.append(metrics[2])
-
-        self.avg_distance.append(metrics[3])
-
-        self.isolated_systems.append(metrics[4])
-
-        self.active_base_stations.append(metrics[5])
-
-        self.snr.append(metrics[6])
+    """
+    Resilience metrics of the rounds of one severity.
+    Only the count, mean and sum of squared differences of every metric are kept,
+    so averages and confidence intervals do not need the samples and two objects merge in O(1).
+    """
+    NAMES = ('isolated_users', 'received_service', 'received_service_half', 'avg_distance', 'isolated_systems',
+             'active_base_stations', 'snr', 'connectedUE_BS', 'active_channels')
 
-        self.connectedUE_BS.append(metrics[7])
-
-        self.active_channels.append(metrics[8])
+    def __init__(self):
+        self.count = np.zeros(len(self.NAMES), dtype=int)
+        self.mean = np.zeros(len(self.NAMES))
+        self.m2 = np.zeros(len(self.NAMES))
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Creates the metrics of many rounds at once
+        :param values: array (round, metric) with the metrics in the order of NAMES, NaN when missing
+        :return: the metrics
+        """
+        metrics = cls()
+        present = ~np.isnan(values)
+        metrics.count = np.count_nonzero(present, axis=0)
+        metrics.mean = np.where(present, values, 0).sum(axis=0) / np.maximum(metrics.count, 1)
+        metrics.m2 = np.where(present, (values - metrics.mean) ** 2, 0).sum(axis=0)
+        return metrics
 
     def get_metrics(self):
-        return util.avg(self.isolated_users), \
-               util.avg(self.received_service), \
-               util.avg(self.received_service_half), \
-               util.avg(self.avg_distance), \
-               util.avg(self.isolated_systems), \
-               util.avg(self.active_base_stations), \
-               util.avg(self.snr), \
-               util.avg(self.connectedUE_BS), \
-               util.avg(self.active_channels)
-
-    def get_cdf(self):
-        return util.cdf(self.isolated_users), \
-               util.cdf(self.received_service), \
-               util.cdf(self.received_service_half), \
-               util.cdf(self.avg_distance), \
-               util.cdf(self.isolated_systems), \
-               util.cdf(self.active_base_stations), \
-               util.cdf(self.snr), \
-               util.cdf(self.connectedUE_BS), \
-               util.cdf(self.active_channels)
-
-    def add_metrics_object(self, metric):
-        self.isolated_users = self.isolated_users + metric.isolated_users
-        self.received_service = self.received_service + metric.received_service
-        self.received_service_half = self.received_service_half + metric.received_service_half
-        self.avg_distance = self.avg_distance + metric.avg_distance
-        self.isolated_systems = self.isolated_systems + metric.isolated_systems
-        self.active_base_stations = self.active_base_stations + metric.active_base_stations
-        self.snr = self.snr + metric.snr
-        self.connectedUE_BS = self.connectedUE_BS + metric.connectedUE_BS
-        self.active_channels = self.active_channels + metric.active_channels
-
-    def csv_export(self):
+        """
+        :return: tuple with the average of each metric, -1 when there are no values
+        """
+        return tuple(float(m) if n > 0 else -1 for m, n in zip(self.mean, self.count))
+
+    def get_cdf(self, confidence=0.95):
+        """
+        :param confidence: confidence level of the interval
+        :return: tuple with the half-width of the t-based confidence interval of each metric,
+        0 when there are less than two values
+        """
         res = []
-        for i in range(len(self.isolated_users)):
-            res.append([self.isolated_users[i],
-                        self.received_service[i],
-                        self.received_service_half[i],
-                        self.avg_distance[i],
-                        self.isolated_systems[i],
-                        self.active_base_stations[i],
-                        self.snr[i],
-                        self.connectedUE_BS[i],
-                        self.active_channels[i]])
+        for n, m2 in zip(self.count, self.m2):
+            if n < 2:
+                res.append(0)
+                continue
+            se = np.sqrt(m2 / (n - 1) / n)
+            res.append(float(se * st.t.ppf((1 + confidence) / 2, n - 1)))
+        return tuple(res)
 
-        return res
+    def add_metrics_object(self, metric):
+        """
+        Merges the metrics of another object into this one
+        :param metric: the other Metrics object
+        :return: None
+        """
+        count = self.count + metric.count
+        delta = metric.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(count > 0, self.mean + delta * metric.count / count, 0)
+            self.m2 = np.where(count > 0, self.m2 + metric.m2 + delta ** 2 * self.count * metric.count / count, 0)
+        self.count = count
 
     def __str__(self):
-        return "({},{},{},{},{},{},{},{},{})".format(util.avg(self.isolated_users),
-                                                     util.avg(self.received_service),
-                                                     util.avg(self.received_service_half),
-                                                     util.avg(self.avg_distance),
-                                                     util.avg(self.isolated_systems),
-                                                     util.avg(self.active_base_stations),
-                                                     util.avg(self.snr),
-                                                     util.avg(self.connectedUE_BS),
-                                                     util.avg(self.active_channels))
+        return "({},{},{},{},{},{},{},{},{})".format(*self.get_metrics())
@@ -0,0 +1,327 @@
+import bisect
+import heapq
+
+import numpy as np
+
+import resilsim.models as models
+import resilsim.settings as settings
+import resilsim.util as util
+
+
+class NetworkState:
+    """
+    State of all channels of a city during a round, stored in arrays indexed by channel id.
+    Channel ids follow the Catalogue: the channels of base station b are ch_start[b]:ch_start[b + 1].
+    Bandwidths are stored as tiers, an index in settings.CHANNEL_BANDWIDTHS with one extra tier for no bandwidth.
+    """
+
+    def __init__(self, catalogue, ue_count, disabled=None):
+        """
+        :param catalogue: static properties of the base stations
+        :param ue_count: number of UEs
+        :param disabled: boolean array, True for the channels that are never enabled (see Catalogue.mmwave_disabled)
+        """
+        self.catalogue = catalogue
+        self.bandwidths = np.array(list(settings.CHANNEL_BANDWIDTHS) + [0], dtype=float)
+        self.zero_tier = len(settings.CHANNEL_BANDWIDTHS)
+        self.max_devices = int(settings.CHANNEL_BANDWIDTHS[0] // settings.CHANNEL_BANDWIDTHS[-1])
+
+        channels = catalogue.channel_count
+        tiers = len(self.bandwidths)
+        # Per base station
+        self.functional = np.ones(len(catalogue))
+        self.zero_count = np.zeros(len(catalogue), dtype=int)  # connected devices without bandwidth
+        # Per channel
+        self.available = np.ones(channels, dtype=bool) if disabled is None else ~disabled  # enabled after a reset
+        self.enabled = self.available.copy()
+        self.frequency = catalogue.ch_frequency
+        self.power = catalogue.ch_power
+        self.beamforming = catalogue.ch_beamforming
+        self.devices = np.zeros(channels, dtype=int)  # number of connected devices
+        self.tier_count = np.zeros((channels, tiers), dtype=int)  # devices per allocated tier
+        self.desired_count = np.zeros((channels, tiers), dtype=int)  # devices per desired tier
+        self.band_used = np.zeros(channels)  # total allocated bandwidth
+        self.band_desired = np.zeros(channels)  # total desired bandwidth
+        # Per UE, allocation on its channel
+        self.ue_channel = np.full(ue_count, -1, dtype=np.int32)
+        self.ue_tier = np.full(ue_count, -1, dtype=np.int32)
+        self.ue_desired = np.full(ue_count, -1, dtype=np.int32)
+        self.ue_seq = np.full(ue_count, -1, dtype=np.int64)  # order in which the UEs connected to their channel
+        self.seq = 0
+        # Sorted used beam angles in degrees (-180, 180], only for channels in use
+        self.angles = dict()
+        # Heaps of (seq, UE) per (channel, tier), the first valid entry is the next device to push down a tier.
+        # Entries of devices that left the tier are skipped when they reach the top
+        self.tier_heaps = dict()
+
+    def reset(self):
+        """
+        Resets all channels to empty and enabled base stations
+        :return: None
+        """
+        self.functional.fill(1)
+        self.zero_count.fill(0)
+        self.enabled[:] = self.available
+        self.devices.fill(0)
+        self.tier_count.fill(0)
+        self.desired_count.fill(0)
+        self.band_used.fill(0)
+        self.band_desired.fill(0)
+        self.ue_channel.fill(-1)
+        self.ue_tier.fill(-1)
+        self.ue_desired.fill(-1)
+        self.ue_seq.fill(-1)
+        self.seq = 0
+        self.angles.clear()
+        self.tier_heaps.clear()
+
+    def channels(self, bs):
+        """
+        :param bs: index of the base station
+        :return: range of the channel ids of the base station
+        """
+        return range(self.catalogue.ch_start[bs], self.catalogue.ch_start[bs + 1])
+
+    def malfunction(self, bs, new_functional, rng):
+        """
+        Sets the functionality of a base station, each channel fails with probability 1 - functional
+        :param bs: index of the base station
+        :param new_functional: functionality between 0 and 1
+        :param rng: RandomStream of the round
+        :return: None
+        """
+        self.functional[bs] = new_functional
+        channels = self.channels(bs)
+        failed = rng.random(len(channels)) >= new_functional
+        self.enabled[channels.start:channels.stop][failed] = False
+
+    def band_left(self, c):
+        if self.beamforming[c]:
+            # Beamforming has one beam per user with the full bandwidth available (for each angle).
+            return settings.CHANNEL_BANDWIDTHS[0]
+        return settings.CHANNEL_BANDWIDTHS[0] - self.band_used[c]
+
+    def has_band_left(self, c):
+        if self.beamforming[c]:
+            return self.enabled[c]
+        return self.enabled[c] and self.devices[c] < self.max_devices
+
+    def productivity(self, c):
+        if self.devices[c] == 0:
+            return 1
+        return min(self.band_used[c] / self.band_desired[c], 1)
+
+    def allocated_bandwidth(self):
+        """
+        :return: array with the bandwidth allocated to each UE, 0 when not connected
+        """
+        return np.where(self.ue_tier >= 0, self.bandwidths[self.ue_tier], 0)
+
+    def can_connect(self, c, ue, i):
+        """
+        Determines if a user can connect to a channel
+        :param c: channel id
+        :param ue: population of user equipment
+        :param i: index of the user equipment
+        :return: True if the user can connect
+        """
+        if not self.enabled[c]:
+            return False
+        if self.beamforming[c]:
+            # determine if the angle (with some margin) is already in use
+            # if not ue can connect otherwise not
+            bs = self.catalogue.ch_bs[c]
+            angle = util.get_angle(ue.lat[i], ue.lon[i], self.catalogue.bs_lat[bs], self.catalogue.bs_lon[bs])
+            if self.angle_in_use(c, angle):
+                return False
+        else:
+            return self.has_band_left(c)
+        return True
+
+    def angle_in_use(self, c, angle):
+        """
+        Determines if a beam of a channel is within the clearance of an angle, the angles wrap around at 180 degrees
+        :param c: channel id
+        :param angle: angle in degrees
+        :return: True if a used beam is within the clearance
+        """
+        used = self.angles.get(c)
+        if not used:
+            return False
+        half = settings.BEAMFORMING_CLEARANCE / 2
+        k = bisect.bisect_left(used, angle - half)
+        if k < len(used) and used[k] <= angle + half:
+            return True
+        # Beams on the other side of -180/180 degrees
+        if angle - half < -180 and used[-1] >= angle - half + 360:
+            return True
+        if angle + half > 180 and used[0] <= angle + half - 360:
+            return True
+        return False
+
+    def _set_tier(self, c, i, tier):
+        old = self.ue_tier[i]
+        if old >= 0:
+            self.tier_count[c, old] -= 1
+            if old == self.zero_tier:
+                self.zero_count[self.catalogue.ch_bs[c]] -= 1
+        if tier == self.zero_tier:
+            self.zero_count[self.catalogue.ch_bs[c]] += 1
+        self.tier_count[c, tier] += 1
+        self.ue_tier[i] = tier
+        self.band_used[c] = self.tier_count[c] @ self.bandwidths
+        heapq.heappush(self.tier_heaps.setdefault((c, tier), []), (self.ue_seq[i], i))
+
+    def _first_of_tier(self, c, tier):
+        """
+        Finds the device of a channel that connected first among the devices with the given tier
+        :param c: channel id
+        :param tier: tier with at least one device
+        :return: index of the device
+        """
+        heap = self.tier_heaps[(c, tier)]
+        while True:
+            seq, i = heap[0]
+            if self.ue_channel[i] == c and self.ue_tier[i] == tier and self.ue_seq[i] == seq:
+                return i
+            heapq.heappop(heap)
+
+    def add_device(self, c, ue, i, minimum_tier):
+        """
+        Attempts to add new device to a channel, pushing the devices with the most bandwidth down a tier
+        until the channel has enough bandwidth
+        :param c: channel id
+        :param ue: population of user equipment
+        :param i: index of the device to add
+        :param minimum_tier: tier of the bandwidth the device needs
+        :return: True if successful otherwise False
+        """
+        # Check if device can be added
+        if not self.can_connect(c, ue, i):
+            return False
+        # Add device
+        self.ue_channel[i] = c
+        self.ue_desired[i] = minimum_tier
+        self.desired_count[c, minimum_tier] += 1
+        self.band_desired[c] = self.desired_count[c] @ self.bandwidths
+        self.devices[c] += 1
+        self.ue_seq[i] = self.seq
+        self.seq += 1
+        if self.beamforming[c]:
+            # If beamforming devices do not need to be reshuffeled.
+            # If a device can be added for the angle it gets all bandwidth and is the only device within the angle
+            self._set_tier(c, i, 0)
+            bs = self.catalogue.ch_bs[c]
+            bisect.insort(self.angles.setdefault(c, []),
+                          util.get_angle(ue.lat[i], ue.lon[i], self.catalogue.bs_lat[bs], self.catalogue.bs_lon[bs]))
+            return True
+        self._set_tier(c, i, minimum_tier)
+        while self.band_left(c) < 0:
+            # Push device with maximum band down, the first connected one when several have the maximum
+            tier = int(np.argmax(self.tier_count[c] > 0))
+            device = self._first_of_tier(c, tier)
+            if tier + 1 >= self.zero_tier:
+                # Could not push this device down a band
+                # Should never be reached
+                print("ERROR: Something within channel went horribly wrong")
+                self._set_tier(c, device, self.zero_tier)
+                break
+
+            self._set_tier(c, device, tier + 1)
+
+        return True
+
+    def remove_device(self, c, i):
+        """
+        Removes a device from a channel, the bandwidth of the other devices is not restored
+        :param c: channel id
+        :param i: index of the device
+        :return: None
+        """
+        self.tier_count[c, self.ue_tier[i]] -= 1
+        if self.ue_tier[i] == self.zero_tier:
+            self.zero_count[self.catalogue.ch_bs[c]] -= 1
+        self.desired_count[c, self.ue_desired[i]] -= 1
+        self.band_used[c] = self.tier_count[c] @ self.bandwidths
+        self.band_desired[c] = self.desired_count[c] @ self.bandwidths
+        self.devices[c] -= 1
+        self.ue_channel[i] = -1
+        self.ue_tier[i] = -1
+        self.ue_desired[i] = -1
+        self.ue_seq[i] = -1
+
+    def overflow(self, bs, ignore=None):
+        """
+        Determines if a connected UE of a base station lost all its bandwidth
+        :param bs: index of the base station
+        :param ignore: index of a UE to leave out of the check
+        :return: True if a connected UE has no bandwidth
+        """
+        zero = self.zero_count[bs]
+        if ignore is not None and self.ue_channel[ignore] >= 0 and self.ue_tier[ignore] == self.zero_tier \
+                and self.catalogue.ch_bs[self.ue_channel[ignore]] == bs:
+            zero -= 1
+        return zero > 0
+
+    def add_ue(self, ue, i, bs, dist=None, powers=None):
+        """
+        Adds a user connection to a base station
+        :param ue: population of user equipment
+        :param i: index of the user equipment to add
+        :param bs: index of the base station
+        :param dist: distance between the basestation and the ue
+        :param powers: received power (mW) of the ue on each channel of the basestation, calculated when None
+        :return: true if successfull otherwise false
+        """
+        # Get best channel to add a device to
+        best_channel = None
+        best_prod = 0
+        best_band_left = 0
+        for c in self.channels(bs):
+            if self.can_connect(c, ue, i) and self.productivity(c) >= best_prod:
+                if self.band_left(c) > best_band_left:
+                    best_channel = c
+                    best_band_left = self.band_left(c)
+                    best_prod = self.productivity(c)
+
+        channel = best_channel
+        if channel is None:  # No channels for the BS has bandwidth left
+            return False
+
+        # Calculate the power for the connection with the channel
+        if dist is None:
+            dist = util.distance_2d(self.catalogue.bs_lon[bs], self.catalogue.bs_lat[bs], ue.lon[i], ue.lat[i])
+        if powers is None:
+            powers, _ = self.catalogue.received_power([bs], [dist], ue.height[i])
+        power = powers[channel - self.catalogue.ch_start[bs]]
+        if power < util.to_pwr(settings.MINIMUM_POWER):
+            return False
+        bandwidth_needed = models.bandwidth_needed(ue.requested_capacity[i], models.snr(power))
+        channel_add = self.add_device(channel, ue, i, settings.CHANNEL_BANDWIDTHS.index(bandwidth_needed))
+        # Additional test that should never trigger
+        # if device failed to be added to the channel or the BS overflows revert and return False
+        if not channel_add:
+            print(f"Failed to add UE[{i}] to channel {channel}")
+            return False
+        # The UE that is being added is not connected yet and not part of the check
+        if self.overflow(bs, ignore=i):
+            print(f"Adding UE[{i}] to channel {channel} cause bs overflow")
+            self.remove_device(channel, i)
+            return False
+        ue.connect(i, bs, channel, power, dist)
+        return True
+
+    def alive_stations(self):
+        """
+        :return: boolean array, True for the base stations with at least one enabled channel
+        """
+        return np.bincount(self.catalogue.ch_bs[self.enabled], minlength=len(self.catalogue)) > 0
+
+    def active_base_stations(self):
+        """
+        :return: number of base stations with at least one enabled channel
+        """
+        return int(np.count_nonzero(self.alive_stations()))
+
+    def active_channels(self):
+        return int(np.count_nonzero(self.enabled))
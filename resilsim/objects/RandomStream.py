@@ -0,0 +1,50 @@
+import numpy as np
+
+import resilsim.settings as settings
+
+
+class RandomStream:
+    """
+    Random numbers of one task, from its own numpy Generator.
+    Uniform and standard normal numbers are drawn in large blocks and handed out in order,
+    so the many small draws of a round do not each pay the overhead of a Generator call.
+    The same seed always gives the same numbers.
+    """
+
+    def __init__(self, seed, block=None):
+        """
+        :param seed: numpy SeedSequence (or int) of the task
+        :param block: number of values drawn at once, settings.RANDOM_BLOCK_SIZE when None
+        """
+        self.generator = np.random.default_rng(seed)
+        self.block = settings.RANDOM_BLOCK_SIZE if block is None else block
+        self._uniform = np.empty(0)
+        self._uniform_pos = 0
+        self._normal = np.empty(0)
+        self._normal_pos = 0
+
+    def random(self, n):
+        """
+        :param n: number of values
+        :return: array with n uniform values in [0, 1)
+        """
+        if self._uniform_pos + n > len(self._uniform):
+            self._uniform = np.concatenate((self._uniform[self._uniform_pos:],
+                                            self.generator.random(max(self.block, n))))
+            self._uniform_pos = 0
+        values = self._uniform[self._uniform_pos:self._uniform_pos + n]
+        self._uniform_pos += n
+        return values
+
+    def standard_normal(self, n):
+        """
+        :param n: number of values
+        :return: array with n values from the standard normal distribution
+        """
+        if self._normal_pos + n > len(self._normal):
+            self._normal = np.concatenate((self._normal[self._normal_pos:],
+                                           self.generator.standard_normal(max(self.block, n))))
+            self._normal_pos = 0
+        values = self._normal[self._normal_pos:self._normal_pos + n]
+        self._normal_pos += n
+        return values
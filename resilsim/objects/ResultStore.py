@@ -0,0 +1,159 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+from resilsim.objects.Metrics import Metrics
+from resilsim.objects.Results import Results
+from resilsim.objects.Summary import Summary
+
+# Columns of every chunk, followed by the metrics in the order of Metrics.NAMES
+COLUMNS = ('severity', 'sample')
+
+
+class ResultStore:
+    """
+    Directory with the results of a simulation run in columnar form.
+    Every append writes a chunk with the rows of one city, an uncompressed NPZ file with an array per column.
+    The manifest lists the chunks with their city and number of rows, so a reader only opens the chunks
+    of the cities it needs and only reads the columns it asks for.
+    A summary of the metrics per city and severity is kept next to the chunks, see summary.
+    """
+
+    def __init__(self, path, new=False):
+        """
+        :param path: directory of the store
+        :param new: start an empty store, the chunks of an earlier store in the directory are removed
+        """
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        self.summary_path = os.path.join(path, 'summary.json')
+        if new or not os.path.exists(self.manifest_path):
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(path):
+                if (name.startswith('chunk_') and name.endswith('.npz')) or name == 'summary.json':
+                    os.remove(os.path.join(path, name))
+            self.manifest = {'columns': list(COLUMNS) + list(Metrics.NAMES), 'chunks': []}
+            self._write_manifest()
+        else:
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def _write_manifest(self):
+        # Written next to the old manifest and renamed, a reader never sees a partial manifest
+        with open(self.manifest_path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    def append(self, city, severity, sample, values):
+        """
+        Writes the rows of a city as a new chunk
+        :param city: name of the city
+        :param severity: array with the severity of each row
+        :param sample: array with the index of each row within its severity
+        :param values: array (row, metric) with the metrics, NaN when missing
+        :return: None
+        """
+        name = f"chunk_{len(self.manifest['chunks'])}.npz"
+        columns = {'severity': np.asarray(severity, dtype=np.int32), 'sample': np.asarray(sample, dtype=np.int32)}
+        for m, metric in enumerate(Metrics.NAMES):
+            columns[metric] = np.asarray(values[:, m], dtype=float)
+        np.savez(os.path.join(self.path, name), **columns)
+        self.manifest['chunks'].append({'file': name, 'city': city, 'rows': len(columns['severity'])})
+        self._write_manifest()
+
+    def append_results(self, city, results):
+        """
+        Writes the added rounds of a city
+        :param city: name of the city
+        :param results: Results of the city
+        :return: None
+        """
+        severity, sample = np.nonzero(results.filled)
+        self.append(city, severity, sample, results.cube[severity, sample])
+
+    def cities(self):
+        """
+        :return: names of the cities in the store, in the order they were written
+        """
+        return list(dict.fromkeys(chunk['city'] for chunk in self.manifest['chunks']))
+
+    def load(self, city=None, columns=None):
+        """
+        Reads columns of the store
+        :param city: name of the city to read, all cities when None
+        :param columns: names of the columns to read, all columns when None
+        :return: Dict(String: Array) the values of each column
+        """
+        if columns is None:
+            columns = self.manifest['columns']
+        chunks = [chunk for chunk in self.manifest['chunks'] if city is None or chunk['city'] == city]
+        parts = {column: [] for column in columns}
+        for chunk in chunks:
+            with np.load(os.path.join(self.path, chunk['file'])) as data:
+                for column in columns:
+                    parts[column].append(data[column])
+        return {column: np.concatenate(parts[column]) if len(parts[column]) > 0 else
+                np.empty(0, dtype=np.int32 if column in COLUMNS else float) for column in columns}
+
+    def column(self, name, city=None):
+        """
+        :param name: name of the column
+        :param city: name of the city to read, all cities when None
+        :return: array with the values of the column
+        """
+        return self.load(city, [name])[name]
+
+    def results(self, city):
+        """
+        :param city: name of the city
+        :return: Results with the rows of the city
+        """
+        data = self.load(city)
+        values = np.column_stack([data[metric] for metric in Metrics.NAMES])
+        return Results.from_rows(data['severity'], data['sample'], values)
+
+    def summary(self):
+        """
+        Gets the summary of the store, the chunks appended since it was last saved are read and merged into it
+        :return: the Summary
+        """
+        summary = Summary.load(self.summary_path) if os.path.exists(self.summary_path) else Summary()
+        chunks = self.manifest['chunks']
+        if summary.chunks > len(chunks):
+            # The store was replaced
+            summary = Summary()
+        if summary.chunks < len(chunks):
+            for chunk in chunks[summary.chunks:]:
+                with np.load(os.path.join(self.path, chunk['file'])) as data:
+                    values = np.column_stack([data[metric] for metric in Metrics.NAMES])
+                    summary.add(chunk['city'], data['severity'], values)
+            summary.chunks = len(chunks)
+            summary.save(self.summary_path)
+        return summary
+
+    @classmethod
+    def from_csv(cls, csv_path, path):
+        """
+        Converts a CSV file written by util.save_data into a store, the rows of a city and severity are numbered
+        in the order of the file
+        :param csv_path: the CSV file
+        :param path: directory of the new store
+        :return: the store
+        """
+        rows = dict()
+        with open(csv_path, newline='') as f:
+            reader = csv.reader(f)
+            next(reader)
+            for row in reader:
+                rows.setdefault(row[0], []).append([float(x) if x != '' else np.nan for x in row[1:]])
+        store = cls(path, new=True)
+        for city, city_rows in rows.items():
+            city_rows = np.array(city_rows)
+            severity = city_rows[:, 0].astype(int)
+            sample = np.zeros(len(severity), dtype=int)
+            for s in np.unique(severity):
+                sample[severity == s] = np.arange(np.count_nonzero(severity == s))
+            store.append(city, severity, sample, city_rows[:, 1:])
+        return store
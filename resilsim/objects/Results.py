@@ -0,0 +1,85 @@
+import numpy as np
+
+import resilsim.settings as settings
+from resilsim.objects.Metrics import Metrics
+
+
+class Results:
+    """
+    Resilience metrics of all rounds of a city in a preallocated array of shape (severity, sample, metric).
+    Sample u * ROUNDS_PER_SEVERITY + r holds round r of round per user u, the metrics are in the order of Metrics.NAMES.
+    Missing values are NaN, samples that were never added are marked in filled.
+    The averages and confidence intervals are reduced per severity by Metrics, the samples are kept for the exports
+    """
+
+    def __init__(self, severities=None, samples=None):
+        if severities is None:
+            severities = settings.SEVERITY_ROUNDS
+        if samples is None:
+            samples = settings.ROUNDS_PER_USER * settings.ROUNDS_PER_SEVERITY
+        self.cube = np.full((severities, samples, len(Metrics.NAMES)), np.nan)
+        self.filled = np.zeros((severities, samples), dtype=bool)
+
+    @classmethod
+    def from_rows(cls, severity, sample, values):
+        """
+        Creates the results from rows, for instance read from a ResultStore
+        :param severity: array with the severity of each row
+        :param sample: array with the index of each row within its severity
+        :param values: array (row, metric) with the metrics, NaN when missing
+        :return: the results
+        """
+        results = cls(int(severity.max()) + 1 if len(severity) > 0 else 0,
+                      int(sample.max()) + 1 if len(sample) > 0 else 0)
+        results.cube[severity, sample] = values
+        results.filled[severity, sample] = True
+        return results
+
+    def add(self, severity, sample, values):
+        """
+        Stores the metrics of one round
+        :param severity: the severity of the round
+        :param sample: index of the round within the severity
+        :param values: array with a value for each metric, NaN when missing
+        :return: None
+        """
+        self.cube[severity, sample] = values
+        self.filled[severity, sample] = True
+
+    def metrics(self):
+        """
+        :return: list with the Metrics of each severity, reduced from the added rounds
+        """
+        return [Metrics.from_values(values) for values in self.cube]
+
+    def counts(self):
+        """
+        :return: array (severity, metric) with the number of values
+        """
+        return np.array([m.count for m in self.metrics()]).reshape(-1, len(Metrics.NAMES))
+
+    def get_metrics(self):
+        """
+        :return: array (severity, metric) with the average of each metric, -1 when there are no values
+        """
+        return np.array([m.get_metrics() for m in self.metrics()]).reshape(-1, len(Metrics.NAMES))
+
+    def get_cdf(self, confidence=0.95):
+        """
+        :param confidence: confidence level of the interval
+        :return: array (severity, metric) with the half-width of the t-based confidence interval of each metric,
+        0 when there are less than two values
+        """
+        return np.array([m.get_cdf(confidence) for m in self.metrics()]).reshape(-1, len(Metrics.NAMES))
+
+    def csv_export(self):
+        """
+        :return: a row [severity, metrics...] for each added round, missing values are None
+        """
+        severity, sample = np.nonzero(self.filled)
+        values = self.cube[severity, sample].astype(object)
+        values[np.isnan(self.cube[severity, sample])] = None
+        return [[int(s)] + list(v) for s, v in zip(severity, values)]
+
+    def __str__(self):
+        return "\n".join("(" + ",".join(str(m) for m in row) + ")" for row in self.get_metrics().tolist())
@@ -0,0 +1,66 @@
+import itertools
+import os
+
+import resilsim.settings as settings
+
+
+class Scenario:
+    """
+    Parameters of one scenario of a run, the workers get the scenario of every task explicitly.
+    The parameters that are not given are taken from settings.
+    All scenarios of a run share the cities, base stations and users; a scenario with a lower MMWAVE_PROBABILITY
+    than the others disables the mmWave channels of the base stations whose draw is above its probability
+    (see Catalogue.mmwave_disabled)
+    """
+    PARAMETERS = ('MMWAVE_PROBABILITY', 'LARGE_DISASTER', 'POWER_OUTAGE', 'RADIUS_PER_SEVERITY', 'RADIUS_SWEEP',
+                  'MALICIOUS_ATTACK', 'PERCENTAGE_BASE_STATIONS', 'FUNCTIONALITY_DECREASED_PER_SEVERITY',
+                  'INCREASING_REQUESTED_DATA', 'OFFSET', 'DATA_PER_SEV', 'WINDOW_SIZE', 'DELTA_RECONNECTION')
+
+    def __init__(self, **parameters):
+        """
+        :param parameters: value of each parameter in PARAMETERS that differs from settings
+        """
+        unknown = set(parameters) - set(self.PARAMETERS)
+        if len(unknown) > 0:
+            raise ValueError(f"Unknown scenario parameters: {', '.join(sorted(unknown))}")
+        self.parameters = dict(parameters)
+        for name in self.PARAMETERS:
+            setattr(self, name, parameters.get(name, getattr(settings, name)))
+
+    @classmethod
+    def grid(cls, grid):
+        """
+        Creates a scenario for every combination of parameter values
+        :param grid: Dict(String: List) the values of each parameter, None for one scenario with the settings
+        :return: list of scenarios
+        """
+        if not grid:
+            return [cls()]
+        names = list(grid)
+        return [cls(**dict(zip(names, values))) for values in itertools.product(*(grid[name] for name in names))]
+
+    @property
+    def name(self):
+        """
+        :return: the parameters of the scenario, empty for the scenario of the settings
+        """
+        return "_".join(f"{name}_{value}" for name, value in self.parameters.items())
+
+    def radius_sweep(self):
+        """
+        :return: True if the radii of a large disaster are simulated as a sweep with one epicentre
+        """
+        return self.LARGE_DISASTER and self.RADIUS_SWEEP
+
+    def path(self, path):
+        """
+        :param path: file or directory of the results of a run
+        :return: the path with the name of the scenario added
+        """
+        if not self.name:
+            return path
+        base, extension = os.path.splitext(path)
+        return f"{base}_{self.name}{extension}"
+
+    def __str__(self):
+        return self.name
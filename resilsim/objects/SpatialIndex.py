@@ -0,0 +1,55 @@
+import itertools
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import resilsim.settings as settings
+
+
+class SpatialIndex:
+    """
+    KD-tree over the locations of the base stations of a city (EPSG:28992).
+    Built once per city, after which the base stations in range of a UE can be found
+    without looping over the whole network.
+    """
+
+    def __init__(self, lon, lat):
+        """
+        :param lon: x coordinates of the base stations
+        :param lat: y coordinates of the base stations
+        """
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.tree = cKDTree(np.column_stack((self.lon, self.lat)))
+
+    def __len__(self):
+        return len(self.lon)
+
+    def query(self, lon, lat, radius=None):
+        """
+        Finds the base stations in range of each location, in compressed sparse row form
+        :param lon: x coordinates of the locations
+        :param lat: y coordinates of the locations
+        :param radius: maximum distance to a base station, settings.BS_RANGE when None
+        :return: tuple (indptr, indices, distances), the base stations in range of location i are found at
+        indptr[i]:indptr[i + 1], sorted from closest to farthest
+        """
+        if radius is None:
+            radius = settings.BS_RANGE
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+
+        indptr = np.zeros(len(lon) + 1, dtype=np.intp)
+        if len(self) == 0 or len(lon) == 0:
+            return indptr, np.empty(0, dtype=np.intp), np.empty(0)
+
+        neighbours = self.tree.query_ball_point(np.column_stack((lon, lat)), radius, return_sorted=True)
+        counts = np.fromiter(map(len, neighbours), dtype=np.intp, count=len(lon))
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.fromiter(itertools.chain.from_iterable(neighbours), dtype=np.intp, count=indptr[-1])
+        location = np.repeat(np.arange(len(lon)), counts)
+        distances = np.sqrt((self.lat[indices] - lat[location]) ** 2 + (self.lon[indices] - lon[location]) ** 2)
+        # The neighbours of a location are sorted by index and lexsort is stable,
+        # so the base station order is kept for equal distances
+        order = np.lexsort((distances, location))
+        return indptr, indices[order], distances[order]
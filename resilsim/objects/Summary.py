@@ -0,0 +1,105 @@
+import json
+import os
+
+import numpy as np
+import scipy.stats as st
+
+from resilsim.objects.Metrics import Metrics
+
+
+class Summary:
+    """
+    Count, mean and sum of squared differences of every metric per city and severity of a ResultStore.
+    The summary remembers how many chunks of the store it contains, the chunks appended later are merged into it
+    (see ResultStore.summary), so the raw rows are read only once.
+    """
+
+    def __init__(self):
+        self.chunks = 0  # number of chunks of the store in the summary
+        self.cities = dict()  # List(Metrics) per severity of each city
+
+    def add(self, city, severity, values):
+        """
+        Merges rows into the summary
+        :param city: name of the city
+        :param severity: array with the severity of each row
+        :param values: array (row, metric) with the metrics, NaN when missing
+        :return: None
+        """
+        metrics = self.cities.setdefault(city, [])
+        for s in np.unique(severity):
+            while s >= len(metrics):
+                metrics.append(Metrics())
+            metrics[s].add_metrics_object(Metrics.from_values(values[severity == s]))
+
+    def counts(self, city):
+        """
+        :return: array (severity, metric) with the number of values of a city
+        """
+        return np.array([m.count for m in self.cities[city]]).reshape(-1, len(Metrics.NAMES))
+
+    def get_metrics(self, city):
+        """
+        :return: array (severity, metric) with the average of each metric of a city, -1 when there are no values
+        """
+        means = np.array([m.mean for m in self.cities[city]]).reshape(-1, len(Metrics.NAMES))
+        return np.where(self.counts(city) > 0, means, -1)
+
+    def variance(self, city):
+        """
+        :return: array (severity, metric) with the sample variance of each metric of a city,
+        0 when there are less than two values
+        """
+        counts = self.counts(city)
+        m2 = np.array([m.m2 for m in self.cities[city]]).reshape(-1, len(Metrics.NAMES))
+        return np.where(counts > 1, m2 / np.maximum(counts - 1, 1), 0)
+
+    def get_cdf(self, city, confidence=0.95):
+        """
+        :param city: name of the city
+        :param confidence: confidence level of the interval
+        :return: array (severity, metric) with the half-width of the t-based confidence interval of each metric,
+        0 when there are less than two values
+        """
+        counts = self.counts(city)
+        se = np.sqrt(self.variance(city) / np.maximum(counts, 1))
+        t = st.t.ppf((1 + confidence) / 2, np.maximum(counts - 1, 1))
+        return np.where(counts > 1, se * t, 0)
+
+    def save(self, path):
+        """
+        Writes the summary as JSON, with the variance and confidence interval for other readers
+        :param path: the file
+        :return: None
+        """
+        cities = dict()
+        for city, metrics in self.cities.items():
+            cities[city] = {'count': self.counts(city).tolist(),
+                            'mean': [m.mean.tolist() for m in metrics],
+                            'm2': [m.m2.tolist() for m in metrics],
+                            'variance': self.variance(city).tolist(),
+                            'half_width': self.get_cdf(city).tolist()}
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'chunks': self.chunks, 'metrics': list(Metrics.NAMES), 'cities': cities}, f)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: file written by save
+        :return: the summary
+        """
+        with open(path) as f:
+            data = json.load(f)
+        summary = cls()
+        summary.chunks = data['chunks']
+        for city, stored in data['cities'].items():
+            metrics = []
+            for count, mean, m2 in zip(stored['count'], stored['mean'], stored['m2']):
+                m = Metrics()
+                m.count = np.array(count, dtype=int)
+                m.mean = np.array(mean)
+                m.m2 = np.array(m2)
+                metrics.append(m)
+            summary.cities[city] = metrics
+        return summary
@@ -1,24 +1,61 @@
-from resilsim.objects.Link import UE_BS_Link
+import numpy as np
+
+import resilsim.models as models
 import resilsim.settings as settings
 
-class UserEquipment:
-    def __init__(self, id: int, lon: float, lat: float, capacity: int):
-        self.id = id
-        self.requested_capacity = capacity
-        self.lon = lon
-        self.lat = lat
-        self.link = None
-        self.height = settings.UE_HEIGHT
 
-    def set_base_station(self, link: UE_BS_Link):
-        self.link = link
+class UEPopulation:
+    """
+    All user equipment of a round stored as arrays.
+    UE i is described by entry i of each array, bs and channel are -1 while the UE is not connected.
+    """
 
-    @property
-    def snr(self):
-        return self.link.snr
+    def __init__(self, lon, lat, capacity, height=settings.UE_HEIGHT):
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        # Requested capacity as drawn, a failure may change requested_capacity until the next reset
+        self.drawn_capacity = np.asarray(capacity, dtype=np.int64).copy()
+        self.requested_capacity = self.drawn_capacity.copy()
+        self.id = np.arange(len(self.lon))
+        self.height = np.full(len(self.lon), height, dtype=float)
+
+        # Connection of each UE
+        self.bs = np.full(len(self.lon), -1, dtype=np.int32)  # index of the base station
+        self.channel = np.full(len(self.lon), -1, dtype=np.int32)  # channel id, see Catalogue
+        self.power = np.zeros(len(self.lon))  # received power in mW
+        self.snr = np.zeros(len(self.lon))
+        self.distance = np.zeros(len(self.lon))
+
+    def __len__(self):
+        return len(self.lon)
 
     def __str__(self):
-        return "UE[{}], requested capacity: {}, lon: {}, lat: {}".format(self.id, self.requested_capacity, self.lon, self.lat)
+        return "UEPopulation[{}], connected: {}".format(len(self), np.count_nonzero(self.connected))
+
+    @property
+    def connected(self):
+        return self.bs >= 0
+
+    def connect(self, i, bs, channel, power, dist):
+        """
+        Stores the connection of UE i
+        :param i: index of the UE
+        :param bs: index of the base station
+        :param channel: id of the channel
+        :param power: received power in mW
+        :param dist: distance to the base station
+        :return: None
+        """
+        self.bs[i] = bs
+        self.channel[i] = channel
+        self.power[i] = power
+        self.snr[i] = models.snr(power)
+        self.distance[i] = dist
 
     def reset(self):
-        self.link = None
+        self.requested_capacity[:] = self.drawn_capacity
+        self.bs.fill(-1)
+        self.channel.fill(-1)
+        self.power.fill(0)
+        self.snr.fill(0)
+        self.distance.fill(0)
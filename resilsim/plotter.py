@@ -1,18 +1,101 @@
 import util
-from objects.City import City
-from objects.Metrics import Metrics
+from resilsim.objects.ResultStore import ResultStore
+from resilsim.objects.Scenario import Scenario
 import resilsim.settings as settings
-import csv
+import hashlib
 import json
+import kaleido
 import plotly.graph_objects as go
 import os
 import plotly.io as pio
-pio.kaleido.scope.mathjax = None
+from multiprocessing import Pool
+
+# Hash of the figure of every exported image, an image is only exported again when its figure changed
+HASH_PATH = os.path.join("images", "figures.json")
+
+
+def init_export_worker():
+    """
+    Starts the Kaleido instance of an export worker process, it renders all figures of the worker
+    :return: None
+    """
+    if hasattr(kaleido, 'start_sync_server'):
+        # Kaleido 1 starts a browser per image unless a server is running
+        pio.defaults.mathjax = None
+        kaleido.start_sync_server(silence_warnings=True)
+    else:
+        pio.kaleido.scope.mathjax = None
+
+
+def export_figure(args):
+    """
+    Writes a figure to its files, called by the workers of export_figures
+    :param args: tuple (figure as dict, list of file paths, hash of the figure)
+    :return: tuple (list of file paths, hash of the figure)
+    """
+    figure, paths, digest = args
+    fig = go.Figure(figure)
+    for path in paths:
+        fig.write_image(path)
+    return paths, digest
+
+
+def export_figures(figures, processes=None):
+    """
+    Writes the figures with a pool of worker processes, each keeping one Kaleido instance.
+    Figures with the same data and layout as at their last export are skipped when their files exist
+    :param figures: list of tuples (figure, list of file paths)
+    :param processes: number of worker processes, settings.AMOUNT_THREADS or the number of cores when None
+    :return: None
+    """
+    if not os.path.exists("images"):
+        os.mkdir("images")
+    hashes = dict()
+    if os.path.exists(HASH_PATH):
+        with open(HASH_PATH) as f:
+            hashes = json.load(f)
+
+    tasks = []
+    for fig, paths in figures:
+        digest = hashlib.sha256(fig.to_json().encode()).hexdigest()
+        if not all(hashes.get(path) == digest and os.path.exists(path) for path in paths):
+            tasks.append((fig.to_dict(), paths, digest))
+    print(f"Exporting {len(tasks)} of {len(figures)} figures")
+    if len(tasks) == 0:
+        return
+
+    processes = min(processes or settings.AMOUNT_THREADS or os.cpu_count(), len(tasks))
+    with Pool(processes, initializer=init_export_worker) as p:
+        for paths, digest in p.imap_unordered(export_figure, tasks):
+            for path in paths:
+                hashes[path] = digest
+            # Saved after every figure, an interrupted export keeps the finished figures
+            with open(HASH_PATH + '.tmp', 'w') as f:
+                json.dump(hashes, f, indent=1)
+            os.replace(HASH_PATH + '.tmp', HASH_PATH)
+
+
+def load_store(name):
+    """
+    Opens the result store of a run. The CSV file of the run is converted when there is no store yet,
+    or again when the CSV file was written after the store
+    :param name: name of the results in the results directory or path of the results, without extension
+    :return: the ResultStore
+    """
+    path = os.path.join(settings.ROOT_DIR, "results", name)
+    manifest = os.path.join(path, "manifest.json")
+    csv_path = path + ".csv"
+    if not os.path.exists(manifest) or \
+            (os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(manifest)):
+        print(f"converting {csv_path}")
+        return ResultStore.from_csv(csv_path, path)
+    return ResultStore(path)
+
 
 def load():
 
-    file = os.path.join(settings.ROOT_DIR, "results", "disaster.csv")
-#    file = os.path.join(settings.ROOT_DIR, "results", "disaster_power.csv")
+    store = load_store("disaster")
+#    store = load_store("disaster_power")
 
     # Get all city names
     all_cities = []
@@ -21,70 +104,33 @@ def load():
         for city in cities:
             all_cities.append(city.get('name'))
 
-    sub_city_results = dict()
-
-    print("importing file")
-    with open(file, newline='') as f:
-
-        filereader = csv.DictReader(f)
-        for row in filereader:
-
-            city = str(row["city"])
-            if city not in all_cities:
-                continue
-            severity = int(row["severity"])
-            isolated_users = float(row["isolated_users"]) if row["isolated_users"] != '' else None
-            received_service = float(row["received_service"]) if row["received_service"] != '' else None
-            received_service_half = float(row["received_service_half"]) if row["received_service_half"] != '' else None
-            avg_distance = float(row["avg_distance"]) if row["avg_distance"] != '' else None
-            isolated_systems = float(row["isolated_systems"]) if row["isolated_users"] != '' else None
-            active_base_stations = float(row["active_base_stations"]) if row["active_base_stations"] else None
-            avg_snr = float(row["avg_snr"]) if row["avg_snr"] else None
-            connected_UE_BS = float(row["connected_UE_BS"]) if row["connected_UE_BS"] else None
-            active_channels = float(row["active_channels"]) if row["active_channels"] else None
-
-            if city not in sub_city_results:
-                sub_city_results[city] = []
-
-            while severity >= len(sub_city_results[city]):
-                sub_city_results[city].append(Metrics())
-
-            sub_city_results[city][severity].add_metric((isolated_users,
-                                                         received_service,
-                                                         received_service_half,
-                                                         avg_distance,
-                                                         isolated_systems,
-                                                         active_base_stations,
-                                                         avg_snr,
-                                                         connected_UE_BS,
-                                                         active_channels))
-
-    city_results = dict()
-    for city in sub_city_results:
-        city_results[City(city,0,0,0,0,0)] = sub_city_results[city]
+    print("importing results")
+    summary = store.summary()
+    store_cities = [city for city in store.cities() if city in all_cities]
 
     print("Plotting results")
 #    util.create_plot(city_results)
 
     x_values, unit = util.get_x_values()
 
+    figures = []
     #    for z in [0, 1, 2, 3, 4, 5, 6, 7, 8]:
     for z in [0, 1]:
         print(f"===========================================================")
         print(f"{util.get_unit(z)}: {x_values}:")
         fig = go.Figure()
-        for city in city_results:
-            results = [m.get_metrics() for m in city_results[city]]
-            errors = [m.get_cdf() for m in city_results[city]]
-            print(f"{city}: {[100*r[z] for r in results if r[z] is not None]}")
+        for city in store_cities:
+            results = summary.get_metrics(city)
+            errors = summary.get_cdf(city)
+            print(f"{city}: {list(100*results[:, z])}")
             fig.add_trace(go.Scatter(
                 x=x_values,
-                y=[100*r[z] for r in results if r[z] is not None],
+                y=100*results[:, z],
                 mode='lines+markers',
-                name=str(city),
+                name=city,
                 error_y=dict(
                     type='data',
-                    array=[100*e[z] for e in errors if e[z] is not None],
+                    array=100*errors[:, z],
                     visible=True
                 )
             ))
@@ -97,21 +143,22 @@ def load():
         fig.update_layout(xaxis_title_font_size=20, yaxis_title_font_size=20)
 
 #        fig.show()
-        if not os.path.exists("images"):
-            os.mkdir("images")
         nt = 'satisfaction' if z == 1 else 'isolated'
-        fig.write_image(f'images/disaster_{nt}.pdf')
-#        fig.write_image(f'images/disaster_power_{nt}.pdf')
-        fig.write_image(f'images/disaster_{nt}.png')
-#        fig.write_image(f'images/disaster_power_{nt}.png')
-
+        figures.append((fig, [f'images/disaster_{nt}.pdf', f'images/disaster_{nt}.png']))
+#        figures.append((fig, [f'images/disaster_power_{nt}.pdf', f'images/disaster_power_{nt}.png']))
 
+    export_figures(figures)
 
-def create_plot_mmwave_comp():
-#    files = [('disaster.csv', 0), ('disaster_mmwave_50.csv', 50), ('disaster_mmwave_100.csv',100)]
-#    files = [('disaster_power.csv', 0), ('disaster_power_mmwave_50.csv', 50), ('disaster_power_mmwave_100.csv', 100)]
-    files = [('disaster_power.csv', 0), ('disaster_power_mmwave_50.csv', 50)]
 
+def create_plot_scenario_comp(grid=None, path=None):
+    """
+    Plots the results of every scenario of a run per city, each scenario is read from its own result store
+    :param grid: Dict(String: List) the values of each parameter of the run, settings.SCENARIOS when None
+    :param path: result store of the run without the names of the scenarios, settings.SAVE_STORE_PATH when None
+    :return: None
+    """
+    scenarios = Scenario.grid(settings.SCENARIOS if grid is None else grid)
+    path = path or settings.SAVE_STORE_PATH
 
 # Get all city names
     all_cities = []
@@ -120,80 +167,42 @@ def create_plot_mmwave_comp():
         for city in cities:
             all_cities.append(city.get('name'))
 
-    results = dict()
-
-    for mmwave_name in files:
-        name = os.path.join(settings.ROOT_DIR, 'results', mmwave_name[0])
-        print(f"importing file {name}")
-        sub_city_results = dict()
-
-        with open(name, newline='') as f:
-            filereader = csv.DictReader(f)
-            for row in filereader:
-                city = str(row["city"])
-                if city not in all_cities:
-                    continue
-                severity = int(row["severity"])
-                isolated_users = float(row["isolated_users"]) if row["isolated_users"] != '' else None
-                received_service = float(row["received_service"]) if row["received_service"] != '' else None
-                received_service_half = float(row["received_service_half"]) if row["received_service_half"] != '' else None
-                avg_distance = float(row["avg_distance"]) if row["avg_distance"] != '' else None
-                isolated_systems = float(row["isolated_systems"]) if row["isolated_users"] != '' else None
-                active_base_stations = float(row["active_base_stations"]) if row["active_base_stations"] else None
-                avg_snr = float(row["avg_snr"]) if row["avg_snr"] else None
-                connected_UE_BS = float(row["connected_UE_BS"]) if row["connected_UE_BS"] else None
-                active_channels = float(row["active_channels"]) if row["active_channels"] else None
-
-                if city not in sub_city_results:
-                    sub_city_results[city] = []
-
-                while severity >= len(sub_city_results[city]):
-                    sub_city_results[city].append(Metrics())
-
-                sub_city_results[city][severity].add_metric((isolated_users,
-                                                             received_service,
-                                                             received_service_half,
-                                                             avg_distance,
-                                                             isolated_systems,
-                                                             active_base_stations,
-                                                             avg_snr,
-                                                             connected_UE_BS,
-                                                             active_channels))
-
-        city_results = dict()
-        for city in sub_city_results:
-            city_results[City(city,0,0,0,0,0)] = sub_city_results[city]
-        results[mmwave_name[1]] = city_results
+    results = [(scenario, load_store(scenario.path(path)).summary()) for scenario in scenarios]
+    name = os.path.basename(path)
 
     print("Plotting results")
 
-    # plot the stuff
-    x_values, unit = util.get_x_values()
-
+    figures = []
     for z in [0, 1]:
         print(f"===========================================================")
-        print(f"{util.get_unit(z)}: {x_values}:")
+        print(f"{util.get_unit(z)}:")
 #        fig = go.Figure()  # when all cities in one fig
         for city in all_cities:
             fig = go.Figure()  # when one city per fig
-            for r in results.keys():  # loop over mmwave deployments
-                city_results = results.get(r)
-                for c in city_results:  # loop over cities
-                    if c.name == city:
-                        metrics = [m.get_metrics() for m in city_results[c]]
-                        errors = [m.get_cdf() for m in city_results[c]]
-                        print(f"{city},{r}%: {[100*m[z] for m in metrics if m[z] is not None]}")
-                        fig.add_trace(go.Scatter(
-                            x=x_values,
-                            y=[100*m[z] for m in metrics if m[z] is not None],
-                            mode='lines+markers',
-                            name=f"{city}: {r}%",
-                            error_y=dict(
-                                type='data',
-                                array=[100*e[z] for e in errors if e[z] is not None],
-                                visible=True
-                            )
-                        ))
+            units = []
+            for scenario, summary in results:  # loop over the scenarios
+                if city in summary.cities:
+                    x_values, unit = util.get_x_values(scenario)
+                    if unit not in units:
+                        units.append(unit)
+                    metrics = summary.get_metrics(city)
+                    errors = summary.get_cdf(city)
+                    label = scenario.name or "settings"
+                    print(f"{city},{label} {x_values}: {list(100*metrics[:, z])}")
+                    fig.add_trace(go.Scatter(
+                        x=x_values,
+                        y=100*metrics[:, z],
+                        mode='lines+markers',
+                        name=f"{city}: {label}",
+                        error_y=dict(
+                            type='data',
+                            array=100*errors[:, z],
+                            visible=True
+                        )
+                    ))
+            if len(units) == 0:
+                continue
+            unit = " / ".join(units)
             if z == 0:
                 fig.update_layout(xaxis_title=unit, yaxis_title=util.get_unit(z),
                                   legend=dict(yanchor="top", y=0.95, xanchor="left", x=0.05))
@@ -202,17 +211,14 @@ def create_plot_mmwave_comp():
                                   legend=dict(yanchor="bottom", y=0.05, xanchor="left", x=0.05))
             fig.update_layout(xaxis_title_font_size=20, yaxis_title_font_size=20)
 
-            if not os.path.exists("images"):
-                os.mkdir("images")
             nt = 'satisfaction' if z == 1 else 'isolated'
-#            fig.write_image(f'images/disaster_mmwave_{city}_{nt}.pdf')
-#            fig.write_image(f'images/disaster_power_mmwave_{city}_{nt}.pdf')
-#            fig.write_image(f'images/disaster_mmwave_{city}_{nt}.png')
-            fig.write_image(f'images/disaster_power_mmwave_{city}_{nt}_new.png')
-            fig.update_layout(title=city)
+#            figures.append((fig, [f'images/{name}_scenarios_{city}_{nt}.pdf']))
+            figures.append((fig, [f'images/{name}_scenarios_{city}_{nt}.png']))
 #            fig.show()  # when one city per fig
 #        fig.show()  # when all cities in one fig
 
+    export_figures(figures)
+
 if __name__ == '__main__':
     #load()
-    create_plot_mmwave_comp()
+    create_plot_scenario_comp()
@@ -9,8 +9,22 @@ CITY_PATH = os.path.join(ROOT_DIR, "data", "city.json")
 SAVE_IN_CSV = False
 CREATE_PLOT = False
 SAVE_CSV_PATH = os.path.join(ROOT_DIR, "results", "disaster_power_mmwave_100.csv")
+SAVE_IN_STORE = False  # columnar result store, read by the plotter
+SAVE_STORE_PATH = os.path.join(ROOT_DIR, "results", "disaster_power_mmwave_100")
+# Directory where the result of every task is stored as soon as it is done, to resume a run with --resume,
+# for instance os.path.join(ROOT_DIR, "results", "checkpoint"). None to disable
+CHECKPOINT_PATH = None
 
 AMOUNT_THREADS = None
+SEED = None  # seed of a simulation run, None for a new seed each run
+LINK_BUDGET_CACHE_SIZE = 500000  # channel entries of cached link budgets per UE population
+RANDOM_BLOCK_SIZE = 65536  # random numbers drawn at once by the random stream of a round
+POWER_BATCH_SIZE = 2048  # UEs whose received powers of a candidate rank are calculated at once
+# Reconnect only the UEs affected by a failure, the received powers are then drawn once per UE population
+DELTA_RECONNECTION = False
+# Values of scenario parameters (see Scenario.PARAMETERS) to simulate every combination of in one run,
+# for example {'MMWAVE_PROBABILITY': [0, 0.5, 1]}. None to simulate the settings only
+SCENARIOS = None
 
 UE_CAPACITY_MIN = 10
 UE_CAPACITY_MAX = 100
@@ -19,6 +33,14 @@ SEVERITY_ROUNDS = 10
 ROUNDS_PER_SEVERITY = 4
 ROUNDS_PER_USER = 75
 
+# Adaptive stopping: after ROUNDS_PER_USER rounds per user, keep adding rounds per user for the (city, severity)
+# combinations whose 95% confidence interval is wider than the target, largest uncertainty first
+ADAPTIVE_STOPPING = False
+ADAPTIVE_HALF_WIDTH = {0: 0.01, 1: 0.01}  # target half-width per metric, by index in Metrics.NAMES
+ADAPTIVE_MAX_ROUNDS_PER_USER = 300  # maximum rounds per user of a city and severity
+ADAPTIVE_MAX_ROUNDS = None  # maximum number of simulated rounds over all cities, None for no limit
+ADAPTIVE_MAX_TIME = None  # maximum run time in seconds, None for no limit
+
 MINIMUM_POWER = -80  # dbm
 
 # CITY SPECIFIC PARAMETERS
@@ -56,6 +78,8 @@ UE_HEIGHT = 1.5  # height in meters
 LARGE_DISASTER = True
 POWER_OUTAGE = True
 RADIUS_PER_SEVERITY = 1000
+# Simulate all radii of a round with one epicentre, the failures of a smaller radius are kept for the larger ones
+RADIUS_SWEEP = False
 
 # malicious attacks on a certain region, for instance a DDoS
 MALICIOUS_ATTACK = False
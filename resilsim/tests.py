@@ -1,9 +1,27 @@
-from objects.Link import UE_BS_Link
+import json
+import os
+import random
+import tempfile
+
 import resilsim.objects.BaseStation as BS
 import resilsim.objects.UE as UE
 import resilsim.util as util
+import resilsim.models as models
 import resilsim.objects.City as City
+from resilsim.objects.Catalogue import Catalogue
+from resilsim.objects.NetworkState import NetworkState
+from resilsim.objects.SpatialIndex import SpatialIndex
+from resilsim.objects.Candidates import Candidates
+from resilsim.objects.LinkBudget import LinkBudget
+from resilsim.objects.Baseline import Baseline
+from resilsim.objects.RandomStream import RandomStream
+from resilsim.objects.Checkpoint import Checkpoint, COLUMNS
+from resilsim.objects.Results import Results
+from resilsim.objects.ResultStore import ResultStore
+from resilsim.objects.Scenario import Scenario
+from resilsim.objects.Metrics import Metrics
 import resilsim.settings as settings
+import resilsim.main as main
 
 import numpy as np
 
@@ -40,16 +58,281 @@ def channel_test():
 
 
 def nr_model_test():
-    ue = UE.UserEquipment(1,2,2,100)
+    ue = UE.UEPopulation([2],[2],[100])
     bs = BS.BaseStation(1,util.BaseStationRadioType.NR,102,102,32,City.Area(0,0,4000,4000))
     bs.add_channel(773,31)
+    state = NetworkState(Catalogue([bs]), len(ue))
 
-    bs.add_ue(ue)
-    power = ue.link.power
+    state.add_ue(ue, 0, 0)
+    power = ue.power[0]
     enough = power > util.to_pwr(settings.MINIMUM_POWER)
     print(f"enough power? {enough}: {power=} with min power = {util.to_pwr(settings.MINIMUM_POWER)}")
 
 
+def batch_models_test(links=20000):
+    """
+    The batch models give the same received powers as the scalar models, with the random terms set to zero
+    """
+    rng = np.random.default_rng(0)
+    d_2d = np.concatenate([rng.uniform(1, 30, links // 10), rng.uniform(1, 5000, links - links // 10)])
+    d_3d = np.sqrt(d_2d ** 2 + (settings.HEIGHT_ABOVE_BUILDINGS - settings.UE_HEIGHT) ** 2)
+    area = rng.choice([a.value for a in util.AreaType], links)
+    radio = rng.choice([r.value for r in util.BaseStationRadioType], links)
+    frequency = rng.choice([700, 1800, 3500, 26000], links).astype(float)
+    tx = rng.uniform(30, 60, links)
+
+    random, lognormal = np.random.random, np.random.lognormal
+    np.random.random = lambda size=None: 0.0 if size is None else np.zeros(size)
+    np.random.lognormal = lambda mean=0, sd=1, size=None: 0.0 if np.ndim(sd) == 0 else np.zeros(np.shape(sd))
+    try:
+        scalar = []
+        for n in range(links):
+            params = models.ModelParameters(d_2d[n], d_3d[n], frequency=frequency[n], area=util.AreaType(area[n]))
+            scalar.append(models.received_power(util.BaseStationRadioType(radio[n]), tx[n], params))
+        batch = models.received_power_batch(radio, tx, d_2d, d_3d, frequency, area)
+    finally:
+        np.random.random, np.random.lognormal = random, lognormal
+    assert np.allclose(batch, scalar, rtol=1e-9, atol=0), "batch models differ from the scalar models"
+    print("batch models equal the scalar models")
+
+
+def test_network(stations=12, users=400, seed=1):
+    """
+    Creates a small network with random base stations and UEs in a 4 by 4 km area
+    :return: tuple (catalogue, spatial index, UE population)
+    """
+    rng = np.random.default_rng(seed)
+    area = City.Area(0, 0, 4000, 4000)
+    area.area_type = util.AreaType.UMA
+    base_stations = []
+    for i in range(stations):
+        bs = BS.BaseStation(i, util.BaseStationRadioType.NR, rng.uniform(0, 4000), rng.uniform(0, 4000),
+                            rng.uniform(15, 45), area, rng)
+        bs.index = i
+        for _ in range(rng.integers(1, 4)):
+            bs.add_channel(rng.choice([700, 1800, 3500]), rng.uniform(40, 62))
+        base_stations.append(bs)
+    catalogue = Catalogue(base_stations)
+    ue = UE.UEPopulation(rng.uniform(0, 4000, users), rng.uniform(0, 4000, users),
+                         rng.integers(settings.UE_CAPACITY_MIN, settings.UE_CAPACITY_MAX, users))
+    return catalogue, SpatialIndex(catalogue.bs_lon, catalogue.bs_lat), ue
+
+
+def delta_reconnection_test():
+    """
+    The delta reconnection of a baseline gives the same association as a full reconnection with the baseline powers
+    """
+    catalogue, index, ue = test_network()
+    state = NetworkState(catalogue, len(ue))
+    candidates = Candidates(index, catalogue, ue)
+    budget = LinkBudget(catalogue, candidates)
+    baseline = Baseline(ue, state, candidates, budget, np.random.SeedSequence(42))
+    for r in range(10):
+        failed = np.random.default_rng(r).choice(len(catalogue), 1 + r % 5, replace=False)
+
+        main.reset_all(state, ue)
+        rng = RandomStream(np.random.SeedSequence(r))
+        for bs in failed:
+            state.malfunction(bs, 0.5, rng)
+        main.connect_ue_bs(ue, state, candidates=candidates, budget=budget, powers=baseline.power)
+        full = [ue.bs.copy(), ue.channel.copy(), ue.power.copy(), state.ue_tier.copy(), state.band_used.copy()]
+
+        main.reset_all(state, ue)
+        rng = RandomStream(np.random.SeedSequence(r))
+        for bs in failed:
+            state.malfunction(bs, 0.5, rng)
+        baseline.reconnect(state, ue)
+        delta = [ue.bs, ue.channel, ue.power, state.ue_tier, state.band_used]
+        assert all(np.array_equal(f, d) for f, d in zip(full, delta)), f"delta reconnection differs in round {r}"
+    print("delta reconnection equals full reconnection")
+
+
+def write_test_data(directory, stations=15):
+    """
+    Writes a city and its base stations in the format of settings.CITY_PATH and settings.BS_PATH
+    :return: tuple (path of the cities, path of the base stations)
+    """
+    rng = random.Random(1)
+    cities = [{"name": "Test", "population": "6000",
+               "UMa": {"min_x": "0", "max_x": "3000", "min_y": "0", "max_y": "3000"}}]
+    antennas = []
+    for i in range(stations):
+        antennas.append({"ID": i, "X": str(rng.uniform(0, 3000)), "Y": str(rng.uniform(0, 3000)),
+                         "HOOFDSOORT": rng.choice(["LTE", "5G NR"]),
+                         "antennes": [{"Hoogte": f"{rng.randint(15, 45)} m",
+                                       "Frequentie": f"{rng.choice([800, 1800, 3500])} MHz",
+                                       "Vermogen": f"{rng.uniform(10, 32):.1f} dBW"}
+                                      for _ in range(rng.randint(1, 3))]})
+    city_path = os.path.join(directory, "city.json")
+    bs_path = os.path.join(directory, "antennas.json")
+    with open(city_path, 'w') as f:
+        json.dump(cities, f)
+    with open(bs_path, 'w') as f:
+        json.dump(antennas, f)
+    return city_path, bs_path
+
+
+def resumed_run(truncate, **overrides):
+    """
+    Runs a generated city with a checkpoint, truncates the file of every job and resumes the run
+    :param truncate: function giving the new size of a job file from its rows, see Checkpoint
+    :param overrides: settings that differ from the test run
+    :return: tuple (names of the jobs, finished tasks of the full run, finished tasks of the resumed run)
+    """
+    test_settings = {'CHECKPOINT_PATH': None, 'SEED': 3, 'AMOUNT_THREADS': 1, 'SEVERITY_ROUNDS': 3,
+                     'ROUNDS_PER_SEVERITY': 2, 'ROUNDS_PER_USER': 2, 'SAVE_IN_CSV': False, 'SAVE_IN_STORE': False,
+                     'CREATE_PLOT': False, 'SCENARIOS': {'MMWAVE_PROBABILITY': [0, 1]}}
+    test_settings.update(overrides)
+    old = {name: getattr(settings, name) for name in list(test_settings) + ['CITY_PATH', 'BS_PATH']}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, value in test_settings.items():
+            setattr(settings, name, value)
+        settings.CITY_PATH, settings.BS_PATH = write_test_data(directory)
+        settings.CHECKPOINT_PATH = os.path.join(directory, "checkpoint")
+        try:
+            main.main()
+            jobs = json.load(open(os.path.join(settings.CHECKPOINT_PATH, "manifest.json")))['jobs']
+            checkpoint = Checkpoint(settings.CHECKPOINT_PATH, jobs, None, resume=True)
+            checkpoint.close()
+            full = checkpoint.finished
+
+            width = len(COLUMNS) + len(Metrics.NAMES)
+            for j in range(len(jobs)):
+                path = os.path.join(settings.CHECKPOINT_PATH, f"job_{j}.bin")
+                rows = np.fromfile(path, dtype=float).reshape(-1, width)
+                with open(path, 'r+b') as f:
+                    f.truncate(truncate(rows))
+            main.main(resume=True)
+            checkpoint = Checkpoint(settings.CHECKPOINT_PATH, jobs, None, resume=True)
+            checkpoint.close()
+        finally:
+            for name, value in old.items():
+                setattr(settings, name, value)
+    return jobs, full, checkpoint.finished
+
+
+def assert_same_tasks(jobs, full, resumed):
+    for j in range(len(jobs)):
+        assert full[j].keys() == resumed[j].keys(), f"tasks of job {jobs[j]} differ"
+        for task, values in full[j].items():
+            assert len(values) == len(resumed[j][task])
+            for (s1, v1), (s2, v2) in zip(values, resumed[j][task]):
+                assert s1 == s2 and np.array_equal(v1, v2, equal_nan=True), f"task {task} of {jobs[j]} differs"
+
+
+def checkpoint_resume_test():
+    """
+    A run resumed from a checkpoint whose last tasks were lost gives the same results as the full run
+    """
+    # Lose the second half of every job, cutting a task in two
+    jobs, full, resumed = resumed_run(lambda rows: rows.nbytes // 2 + 13)
+    assert_same_tasks(jobs, full, resumed)
+    print("resumed run equals full run")
+
+
+def adaptive_resume_test():
+    """
+    An adaptive run resumed between two waves plans the next waves and gives the same results as the full run
+    """
+    # Keep the first ROUNDS_PER_USER rounds per user, the run stopped right after them
+    jobs, full, resumed = resumed_run(lambda rows: rows[rows[:, 0] < 2].nbytes,
+                                      ADAPTIVE_STOPPING=True, ADAPTIVE_MAX_ROUNDS_PER_USER=5)
+    assert any(u >= 2 for tasks in full for u, _, _ in tasks), "the full run added no waves"
+    assert_same_tasks(jobs, full, resumed)
+    print("resumed adaptive run equals full run")
+
+
+def results_test():
+    """
+    The rounds added to the results are kept per severity and sample, missing values are skipped in the averages
+    """
+    results = Results(3, 4)
+    results.add(0, 0, np.arange(len(Metrics.NAMES), dtype=float))
+    values = np.arange(len(Metrics.NAMES), dtype=float) + 2
+    values[1] = np.nan
+    results.add(0, 3, values)
+    metrics = results.get_metrics()
+    assert metrics[0, 0] == 1 and metrics[0, 1] == 1 and np.all(metrics[1:] == -1)
+    assert results.counts()[0, 1] == 1 and results.counts()[0, 0] == 2
+    assert results.get_cdf()[0, 1] == 0 and results.get_cdf()[0, 0] > 0
+    rows = results.csv_export()
+    assert len(rows) == 2 and rows[1][0] == 0 and rows[1][2] is None
+    severity, sample = np.nonzero(results.filled)
+    copy = Results.from_rows(severity, sample, results.cube[severity, sample])
+    assert np.array_equal(copy.get_metrics(), metrics[:1])
+    print("results keep the rounds")
+
+
+def result_store_test():
+    """
+    Results written to a store read back the same, directly and through the summary
+    """
+    rng = np.random.default_rng(5)
+    results = Results(4, 10)
+    for s in range(4):
+        for n in range(10 if s < 3 else 1):
+            values = rng.random(len(Metrics.NAMES))
+            values[rng.random(len(values)) < 0.2] = np.nan
+            results.add(s, n, values)
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultStore(directory, new=True)
+        store.append_results("Test", results)
+        store.append_results("Other", results)
+        read = ResultStore(directory).results("Test")
+        missing = ResultStore(directory).results("Nowhere")
+        summary = store.summary()
+    assert store.cities() == ["Test", "Other"]
+    assert missing.cube.size == 0 and not missing.filled.any()
+    assert np.array_equal(read.cube[read.filled], results.cube[results.filled], equal_nan=True)
+    assert np.allclose(summary.get_metrics("Test"), results.get_metrics())
+    assert np.allclose(summary.get_cdf("Test"), results.get_cdf())
+    print("result store and summary match the results")
+
+
+def scenario_test():
+    """
+    A grid gives a scenario for every combination, with the other parameters from settings
+    """
+    scenarios = Scenario.grid({'MMWAVE_PROBABILITY': [0, 0.5, 1], 'POWER_OUTAGE': [False, True]})
+    assert len(scenarios) == 6
+    assert len(set(scenario.name for scenario in scenarios)) == 6
+    assert all(scenario.LARGE_DISASTER == settings.LARGE_DISASTER for scenario in scenarios)
+    assert scenarios[1].path("results/run.csv") == "results/run_MMWAVE_PROBABILITY_0_POWER_OUTAGE_True.csv"
+    assert len(Scenario.grid(None)) == 1 and Scenario.grid(None)[0].path("run.csv") == "run.csv"
+    try:
+        Scenario(UNKNOWN=1)
+        assert False, "unknown parameter accepted"
+    except ValueError:
+        pass
+    print("scenario grid is complete")
+
+
+def adaptive_stopping_test():
+    """
+    A severity with one round is uncertain, one whose rounds agree has reached its target
+    """
+    results = Results(2, 10)
+    values = np.full(len(Metrics.NAMES), 0.5)
+    results.add(0, 0, values)
+    assert main.cell_uncertainty(results, 0) == np.inf
+    for n in range(1, 10):
+        results.add(0, n, values)
+    assert main.cell_uncertainty(results, 0) == 0
+    results.add(1, 0, values)
+    results.add(1, 1, values + 0.2)
+    assert main.cell_uncertainty(results, 1) > 1
+    assert main.cell_uncertainty(results, None) == main.cell_uncertainty(results, 1)
+    print("adaptive stopping rule")
+
+
 if __name__ == '__main__':
     nr_model_test()
+    batch_models_test()
+    delta_reconnection_test()
+    checkpoint_resume_test()
+    adaptive_resume_test()
+    results_test()
+    result_store_test()
+    scenario_test()
+    adaptive_stopping_test()
     #main_test()
@@ -5,6 +5,8 @@ import re
 import numpy as np
 
 import resilsim.settings as settings
+from resilsim.objects.ResultStore import ResultStore
+from resilsim.objects.Scenario import Scenario
 import plotly.graph_objects as go
 import scipy.stats as st
 
@@ -69,97 +71,60 @@ def distance_3d(h1, h2, x1=None, y1=None, x2=None, y2=None, d2d=None):
     return math.sqrt(d_2d ** 2 + dist_h ** 2)
 
 
-def isolated_users(ue):
-    counter = 0
-    for user in ue:
-        if user.link is None:
-            counter += 1
-    return counter / len(ue)
-
-
-def received_service(ue):
-    percentages = []
+def shannon_capacity(state, ue):
+    """
+    Calculates the shannon capacity of every UE with the bandwidth currently allocated to it
+    :param state: state of the network
+    :param ue: population of UEs
+    :return: array with the capacity per UE, 0 when not connected
+    """
+    return state.allocated_bandwidth() * np.log2(1 + ue.snr)
 
-    for user in ue:
-        if user.link is not None:
-            percentages.append(
-                1 if user.link.shannon_capacity / user.requested_capacity > 1
-                else user.link.shannon_capacity / user.requested_capacity)
-        else:
-            percentages.append(0)
 
-    return sum(percentages) / len(percentages) if len(percentages) != 0 else 0
+def isolated_users(ue):
+    return np.count_nonzero(~ue.connected) / len(ue)
 
 
-def received_service_half(ue):
-    counter = 0
+def received_service(ue, capacity):
+    if len(ue) == 0:
+        return 0
+    connected = ue.connected
+    percentages = np.zeros(len(ue))
+    percentages[connected] = np.minimum(capacity[connected] / ue.requested_capacity[connected], 1)
+    return float(percentages.mean())
 
-    for user in ue:
-        if user.link is not None:
-            if user.link.shannon_capacity / user.requested_capacity >= 0.5:
-                counter += 1
 
-    return counter / len(ue)
+def received_service_half(ue, capacity):
+    connected = ue.connected
+    return np.count_nonzero(capacity[connected] / ue.requested_capacity[connected] >= 0.5) / len(ue)
 
 
 def avg_distance(ue):
-    distances = []
-    for user in ue:
-        if user.link:
-            distances.append(user.link.distance)
-
-    return sum(distances) / len(distances) if len(distances) != 0 else None  # not 1 user is connected so infinite
-
+    connected = ue.connected
+    # not 1 user is connected so infinite
+    return float(ue.distance[connected].mean()) if np.any(connected) else None
 
-def isolated_systems(base_stations):
-    systems = 0
-    bs_copy = base_stations[:]
-    while len(bs_copy) != 0:
-        systems += 1
-        first = bs_copy.pop(0)
-        checked = [link.other(first) for link in first.connected_BS[:]]
-        while len(checked) != 0:
-            second = checked.pop(0)
-            if second in bs_copy:
-                bs_copy.remove(second)
-                checked = checked + [link.other(second) for link in second.connected_BS[:]]
 
-    return systems
+def isolated_systems(catalogue):
+    return int(catalogue.systems()[0])
 
 
 def snr_averages(ue):
-    snrs = []
-    for user in ue:
-        if user.link:
-            snrs.append(user.snr)
-        else:
-            snrs.append(0)
-    return sum(snrs) / len(snrs) if len(snrs) > 0 else 0
+    return float(ue.snr.mean()) if len(ue) > 0 else 0
 
 
-def active_base_stations(bs):  # TODO make nicer (if BS has channels available set as active)
-    ab = 0
-    for b in bs:
-        for c in b.channels:
-            if c.enabled:
-                ab += 1
-                break
-    return ab
+def active_base_stations(state):  # TODO make nicer (if BS has channels available set as active)
+    return state.active_base_stations()
 
 
 #    return sum([1 if bs.functional >= 0.2 else 0 for bs in bs])
 
-def active_channels(bs):
-    ac = 0
-    for b in bs:
-        for c in b.channels:
-            if c.enabled:
-                ac += 1
-    return ac
+def active_channels(state):
+    return state.active_channels()
 
 
-def connected_ue_bs(base_stations):
-    return sum([len(bs.connected_UE) for bs in base_stations]) / len(base_stations)
+def connected_ue_bs(state, ue):
+    return np.count_nonzero(ue.connected) / len(state.catalogue)
 
 
 def to_pwr(db):
@@ -225,36 +190,52 @@ def get_unit(index):
         return "Error"
 
 
-def get_x_values():
-    if settings.LARGE_DISASTER:
-        return [settings.RADIUS_PER_SEVERITY * r for r in range(settings.SEVERITY_ROUNDS)], "Radius disaster (meters)"
-    elif settings.MALICIOUS_ATTACK:
-        return [(settings.FUNCTIONALITY_DECREASED_PER_SEVERITY * s) for s in
+def get_x_values(scenario=None):
+    """
+    :param scenario: the scenario of the results, the scenario of the settings when None
+    :return: tuple (the severities as values of the x-axis, unit of the x-axis)
+    """
+    if scenario is None:
+        scenario = Scenario()
+    if scenario.LARGE_DISASTER:
+        return [scenario.RADIUS_PER_SEVERITY * r for r in range(settings.SEVERITY_ROUNDS)], "Radius disaster (meters)"
+    elif scenario.MALICIOUS_ATTACK:
+        return [(scenario.FUNCTIONALITY_DECREASED_PER_SEVERITY * s) for s in
                 range(settings.SEVERITY_ROUNDS)], "Functionality decreased of BS"
-    elif settings.INCREASING_REQUESTED_DATA:
+    elif scenario.INCREASING_REQUESTED_DATA:
         return [s for s in range(settings.SEVERITY_ROUNDS)], "Severity level of increasing data"
 
 
-def create_plot(city_results):
-    x_values, unit = get_x_values()
+def create_plot(city_results, scenarios=None):
+    """
+    :param city_results: Dict(String: Results) the results of each city
+    :param scenarios: Dict(String: Scenario) the scenario of the results of each city, the settings when None
+    :return: None
+    """
+    scenarios = scenarios or dict()
 
     #    for z in [0, 1, 2, 3, 4, 5, 6, 7, 8]:
     for z in [0, 1]:
         fig = go.Figure()
+        units = []
         for city in city_results:
-            results = [m.get_metrics() for m in city_results[city]]
-            errors = [m.get_cdf() for m in city_results[city]]
+            x_values, unit = get_x_values(scenarios.get(city))
+            if unit not in units:
+                units.append(unit)
+            results = city_results[city].get_metrics()
+            errors = city_results[city].get_cdf()
             fig.add_trace(go.Scatter(
                 x=x_values,
-                y=[r[z] for r in results if r[z] is not None],
+                y=results[:, z],
                 mode='lines+markers',
                 name=str(city),
                 error_y=dict(
                     type='data',
-                    array=[e[z] for e in errors if e[z] is not None],
+                    array=errors[:, z],
                     visible=True
                 )
             ))
+        unit = " / ".join(units)
         if z == 0:
             fig.update_layout(xaxis_title=unit, yaxis_title=get_unit(z),
                               legend=dict(yanchor="top", y=0.95, xanchor="left", x=0.05))
@@ -276,21 +257,27 @@ def cdf(data, confidence=0.95):
     return h
 
 
-def create_new_file():
-    with open(settings.SAVE_CSV_PATH, 'w', newline='') as f:
+def create_new_file(path=None):
+    with open(path or settings.SAVE_CSV_PATH, 'w', newline='') as f:
         fieldnames = ['city', 'severity', 'isolated_users', 'received_service', 'received_service_half', 'avg_distance',
                       'isolated_systems', 'active_base_stations', 'avg_snr', 'connected_UE_BS', 'active_channels']
         csv_writer = csv.writer(f)
         csv_writer.writerow(fieldnames)
 
 
-def save_data(city, metrics):
-    with open(settings.SAVE_CSV_PATH, 'a', newline='') as f:
+def save_data(city, results, path=None):
+    with open(path or settings.SAVE_CSV_PATH, 'a', newline='') as f:
         csv_writer = csv.writer(f)
-        for i in range(settings.SEVERITY_ROUNDS):
-            metric = metrics[i].csv_export()
-            for m in metric:
-                csv_writer.writerow([city.name, i] + m)
+        for row in results.csv_export():
+            csv_writer.writerow([city.name] + row)
+
+
+def create_new_store(path=None):
+    ResultStore(path or settings.SAVE_STORE_PATH, new=True)
+
+
+def save_store(city, results, path=None):
+    ResultStore(path or settings.SAVE_STORE_PATH).append_results(city.name, results)
 
 
 @enum.unique